@@ -0,0 +1,59 @@
+#
+# Requests per second of the forum front page with the page cache on and off.
+#
+# Calls the WSGI Dispatcher in-process, so only the application and the
+# database are measured:
+#
+#   python bench_pagecache.py --requests 2000
+#
+
+import argparse
+import time
+
+import forum
+
+
+def Run(requests, write_every):
+    '''Send requests GETs to /, and a POST every write_every GETs.
+
+    Returns:
+      Requests per second.
+    '''
+    def resp(status, headers):
+        pass
+
+    start = time.time()
+    for i in xrange(requests):
+        if write_every and i and i % write_every == 0:
+            body = 'content=bench+post+%d' % i
+            env = {'PATH_INFO': '/post', 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                   'CONTENT_LENGTH': str(len(body)), 'wsgi.input': _Input(body)}
+        else:
+            env = {'PATH_INFO': '/', 'QUERY_STRING': '', 'SCRIPT_NAME': ''}
+        ''.join(forum.Dispatcher(env, resp))
+    return requests / (time.time() - start)
+
+
+class _Input(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, length):
+        return self.data[:length]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the forum page cache.')
+    parser.add_argument('--requests', type=int, default=2000, help='no. of requests per run')
+    parser.add_argument('--write-every', type=int, default=1000,
+                        help='add a post every N requests, 0 for read-only')
+    args = parser.parse_args()
+
+    for enabled in (False, True):
+        forum.PAGE_CACHE = forum.pagecache.PageCache(enabled=enabled)
+        rps = Run(args.requests, args.write_every)
+        print 'cache %-3s %8.1f req/s  %s' % ('on' if enabled else 'off', rps, forum.PAGE_CACHE.Stats())
+
+
+if __name__ == '__main__':
+    main()
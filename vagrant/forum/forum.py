@@ -4,61 +4,101 @@
 
 # The forumdb module is where the database interface code goes.
 import forumdb
+import pagecache
+import sanitize
+import tracing
+# HTML templates, shared with the asyncio app in forum_async.py
+from pages import POST, HTML_HEAD, HTML_TAIL, RenderPage, RenderResults, FormatCursor, ParseCursor, ParseSearch
 
 # Other modules used to run a web server.
+import argparse
 import cgi
-from wsgiref.simple_server import make_server
+import os
+import signal
+import SocketServer
+import threading
+from wsgiref.simple_server import make_server, WSGIServer
 from wsgiref import util
 
-# HTML template for the forum page
-HTML_WRAP = '''\
-<!DOCTYPE html>
-<html>
-  <head>
-    <title>DB Forum</title>
-    <style>
-      h1, form { text-align: center; }
-      textarea { width: 400px; height: 100px; }
-      div.post { border: 1px solid #999;
-                 padding: 10px 10px;
-		 margin: 10px 20%%; }
-      hr.postbound { width: 50%%; }
-      em.date { color: #999 }
-    </style>
-  </head>
-  <body>
-    <h1>DB Forum</h1>
-    <form method=post action="/post">
-      <div><textarea id="content" name="content"></textarea></div>
-      <div><button id="go" type="submit">Post message</button></div>
-    </form>
-    <!-- post content will go here -->
-%s
-  </body>
-</html>
-'''
-
-# HTML template for an individual comment
-POST = '''\
-    <div class=post><em class=date>%(time)s</em><br>%(content)s</div>
-'''
+# rendered pages, dropped whenever a post is added
+PAGE_CACHE = pagecache.PageCache()
 
 
 ## Request handler for main page
+@tracing.Traced
 def View(env, resp):
     '''View is the 'main page' of the forum.
 
     It displays the submission form and the previously posted messages.
     '''
-    # get posts from database
-    posts = forumdb.GetAllPosts()
+    query = env.get('QUERY_STRING', '')
+    if 'all' in cgi.parse_qs(query):
+        return ViewAll(env, resp)
+
+    before = ParseCursor(query)
+
+    def Render():
+        # get one page of posts from database
+        posts, next = forumdb.GetPosts(before)
+        return RenderPage(posts, next)
+
+    key = FormatCursor(before) if before is not None else ''
+    etag, html = PAGE_CACHE.Get(key, Render)
+    headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+
+    # client already has this version of the page
+    if etag in env.get('HTTP_IF_NONE_MATCH', '').split(', '):
+        PAGE_CACHE.NotModified()
+        resp('304 Not Modified', headers)
+        return []
+
+    # send results
+    headers.append(('Content-type', 'text/html'))
+    resp('200 OK', headers)
+    return [html]
+
+
+## Request handler for the main page with every post
+def ViewAll(env, resp):
+    '''ViewAll streams the main page with all the posts, newest first.
+
+    The page goes out in pieces - head, one chunk per batch of posts, tail -
+    so the first byte is sent and memory use stays flat however many posts
+    there are.
+    '''
+    headers = [('Content-type', 'text/html')]
+    resp('200 OK', headers)
+    return StreamPage(forumdb.IterPosts())
+
+
+def StreamPage(batches):
+    '''Yield the page for an iterable of post batches, closing it when done.'''
+    try:
+        yield HTML_HEAD
+        for posts in batches:
+            yield ''.join(POST % p for p in posts)
+        yield HTML_TAIL
+    finally:
+        batches.close()
+
+
+## Request handler for searching posts
+@tracing.Traced
+def Search(env, resp):
+    '''Search shows the posts matching the words in the query string (q),
+    best match first, one page at a time.
+    '''
+    q, page = ParseSearch(env.get('QUERY_STRING', ''))
+    posts, next = forumdb.SearchPosts(q, page)
+
     # send results
     headers = [('Content-type', 'text/html')]
     resp('200 OK', headers)
-    return [HTML_WRAP % ''.join(POST % p for p in posts)]
+    return [RenderResults(q, posts, next)]
 
 
 ## Request handler for posting - inserts to database
+@tracing.Traced
 def Post(env, resp):
     '''Post handles a submission of the forum's form.
   
@@ -78,6 +118,8 @@ def Post(env, resp):
         if content:
             # Save it in the database
             forumdb.AddPost(content)
+            # cached pages don't show the new post
+            PAGE_CACHE.Invalidate()
     # 302 redirect back to the main page
     headers = [('Location', '/'),
                ('Content-type', 'text/plain')]
@@ -85,9 +127,37 @@ def Post(env, resp):
     return ['Redirecting']
 
 
+## Request handler for metrics
+def Metrics(env, resp):
+    '''Metrics serves the counters of this process in the Prometheus text
+    format: traced queries and calls (see tracing.py; empty unless tracing
+    is on), the page cache and the sanitizer cache. ?format=text serves the
+    traced queries as a text report instead.
+    '''
+    if cgi.parse_qs(env.get('QUERY_STRING', '')).get('format') == ['text']:
+        resp('200 OK', [('Content-type', 'text/plain')])
+        return [tracing.Report()]
+
+    lines = [tracing.Metrics('forum')]
+    for name, stats in (('page_cache', PAGE_CACHE.Stats()), ('sanitize', sanitize.Stats())):
+        for key, value in sorted(stats.items()):
+            # cache sizes and hit rates are gauges, everything else counts events
+            if key in ('pages', 'size', 'hit_rate'):
+                lines.append("# TYPE forum_%s_%s gauge\nforum_%s_%s %s\n" % (name, key, name, key, value))
+            else:
+                lines.append("# TYPE forum_%s_%s_total counter\nforum_%s_%s_total %d\n"
+                             % (name, key, name, key, value))
+
+    headers = [('Content-type', 'text/plain; version=0.0.4')]
+    resp('200 OK', headers)
+    return [''.join(lines)]
+
+
 ## Dispatch table - maps URL prefixes to request handlers
 DISPATCH = {'': View,
             'post': Post,
+            'search': Search,
+            'metrics': Metrics,
             }
 
 
@@ -104,7 +174,100 @@ def Dispatcher(env, resp):
         return ['Not Found: ' + page]
 
 
-# Run this bad server only on localhost!
-httpd = make_server('', 8000, Dispatcher)
-print "Serving HTTP on port 8000..."
-httpd.serve_forever()
+## Serving modes
+
+class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+    '''WSGI server handling every request in its own thread.'''
+    # let requests in flight finish when the server shuts down
+    daemon_threads = False
+
+
+def Serve(host='', port=8000, mode='threaded', workers=4):
+    '''Serve Dispatcher until SIGTERM or SIGINT, then shut down gracefully.
+
+    Args:
+      host, port: address to listen on.
+      mode: 'single' handles one request at a time, 'threaded' one thread
+        per request, 'prefork' forks workers processes that accept on the
+        same socket.
+      workers: no. of worker processes in 'prefork' mode.
+    '''
+    if mode == 'threaded':
+        httpd = make_server(host, port, Dispatcher, server_class=ThreadingWSGIServer)
+    else:
+        httpd = make_server(host, port, Dispatcher)
+
+    if mode != 'prefork':
+        _ServeUntilSignal(httpd)
+        return
+
+    # listening socket is opened once and shared by all workers
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _ServeUntilSignal(httpd)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def Stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, Stop)
+    signal.signal(signal.SIGINT, Stop)
+
+    # wait for every worker to finish its requests and exit
+    while children:
+        try:
+            pid, _ = os.wait()
+        except OSError:
+            # interrupted by a signal
+            continue
+        children.remove(pid)
+    httpd.server_close()
+
+
+def _ServeUntilSignal(httpd):
+    '''Run httpd.serve_forever() until SIGTERM or SIGINT.'''
+    def Stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it can't be
+        # called from the thread running it
+        threading.Thread(target=httpd.shutdown).start()
+
+    signal.signal(signal.SIGTERM, Stop)
+    signal.signal(signal.SIGINT, Stop)
+    httpd.serve_forever()
+    httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the DB Forum server.')
+    parser.add_argument('--host', default='', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('--mode', choices=('single', 'threaded', 'prefork'), default='threaded',
+                        help='how requests are served')
+    parser.add_argument('--workers', type=int, default=4, help='no. of processes in prefork mode')
+    parser.add_argument('--trace', action='store_true',
+                        help='time every query by the request handler that issued it, see /metrics')
+    parser.add_argument('--group-commit', action='store_true',
+                        help='commit concurrent posts together, see forumdb.EnableGroupCommit()')
+    parser.add_argument('--max-batch', type=int, default=100, help='max. no. of posts per group commit')
+    parser.add_argument('--max-delay', type=float, default=5,
+                        help='max. milliseconds a post waits for others to share its commit')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.Enable()
+    if args.group_commit:
+        # writers are started per process, so prefork workers get their own
+        forumdb.EnableGroupCommit(args.max_batch, args.max_delay / 1000.0)
+
+    # Run this bad server only on localhost!
+    print "Serving HTTP on port %d (%s)..." % (args.port, args.mode)
+    Serve(args.host, args.port, args.mode, args.workers)
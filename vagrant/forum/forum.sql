@@ -1,5 +1,27 @@
 
-CREATE TABLE posts ( content TEXT,
-                     time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                     id SERIAL );
+-- Safe to run again on an existing forum database: it adds what is missing
+-- (column, indexes, trigger) and fills in search for the posts already there.
 
+CREATE TABLE IF NOT EXISTS posts ( content TEXT,
+                                   time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                   id SERIAL,
+                                   search TSVECTOR );
+
+-- databases created before full-text search
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search TSVECTOR;
+
+-- serves GetPosts' keyset pagination: ORDER BY time DESC, id DESC
+CREATE INDEX IF NOT EXISTS posts_time_id_idx ON posts (time DESC, id DESC);
+
+-- full-text search for SearchPosts: search @@ query
+CREATE INDEX IF NOT EXISTS posts_search_idx ON posts USING GIN (search);
+
+-- keeps search up to date with content
+DROP TRIGGER IF EXISTS posts_search_update ON posts;
+CREATE TRIGGER posts_search_update BEFORE INSERT OR UPDATE OF content ON posts
+FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search, 'pg_catalog.english', content);
+
+-- backfill posts written before the trigger existed; same value as the
+-- trigger's (a NULL content gives an empty tsvector)
+UPDATE posts SET search = to_tsvector('pg_catalog.english', coalesce(content, ''))
+WHERE search IS NULL;
@@ -0,0 +1,128 @@
+#
+# DB Forum - asyncio (ASGI) version of forum.py, for Python 3
+#
+# Serves the same pages as the WSGI Dispatcher in forum.py from a single
+# event loop, e.g. with uvicorn:
+#
+#   python3 forum_async.py --port 8000
+#   uvicorn forum_async:Dispatcher --port 8000
+#
+
+import argparse
+from urllib.parse import parse_qs
+
+import forumdb_async
+from pagecache import ETag
+from pages import POST, HTML_HEAD, HTML_TAIL, RenderPage, RenderResults, ParseCursor, ParseSearch
+
+
+async def _Send(send, status, headers, body=b''):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+## Request handler for main page
+async def View(scope, receive, send):
+    '''View is the 'main page' of the forum, see forum.View.'''
+    query = scope.get('query_string', b'').decode('latin-1')
+    if 'all' in parse_qs(query):
+        return await ViewAll(scope, receive, send)
+
+    # get one page of posts from database
+    posts, next = await forumdb_async.GetPosts(ParseCursor(query))
+    html = RenderPage(posts, next).encode('utf-8')
+    etag = ETag(html)
+    headers = [('etag', etag), ('cache-control', 'no-cache')]
+
+    # client already has this version of the page
+    request_headers = dict(scope.get('headers', []))
+    if etag in request_headers.get(b'if-none-match', b'').decode('latin-1').split(', '):
+        return await _Send(send, 304, headers)
+
+    # send results
+    headers.append(('content-type', 'text/html'))
+    await _Send(send, 200, headers, html)
+
+
+## Request handler for the main page with every post
+async def ViewAll(scope, receive, send):
+    '''ViewAll streams the main page with all the posts, see forum.ViewAll.'''
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/html')]})
+    await send({'type': 'http.response.body', 'body': HTML_HEAD.encode('utf-8'), 'more_body': True})
+    async for posts in forumdb_async.IterPosts():
+        chunk = ''.join(POST % p for p in posts)
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': HTML_TAIL.encode('utf-8')})
+
+
+## Request handler for searching posts
+async def Search(scope, receive, send):
+    '''Search shows the posts matching a query, see forum.Search.'''
+    q, page = ParseSearch(scope.get('query_string', b'').decode('latin-1'))
+    posts, next = await forumdb_async.SearchPosts(q, page)
+    html = RenderResults(q, posts, next).encode('utf-8')
+    await _Send(send, 200, [('content-type', 'text/html')], html)
+
+
+## Request handler for posting - inserts to database
+async def Post(scope, receive, send):
+    '''Post handles a submission of the forum's form, see forum.Post.'''
+    # Get post content
+    postdata = b''
+    while True:
+        message = await receive()
+        postdata += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    # If length is zero, post is empty - don't save it.
+    if postdata:
+        fields = parse_qs(postdata.decode('utf-8'))
+        content = fields.get('content', [''])[0]
+        # If the post is just whitespace, don't save it.
+        content = content.strip()
+        if content:
+            # Save it in the database
+            await forumdb_async.AddPost(content)
+    # 302 redirect back to the main page
+    await _Send(send, 302, [('location', '/'), ('content-type', 'text/plain')], b'Redirecting')
+
+
+## Dispatch table - maps URL prefixes to request handlers
+DISPATCH = {'': View,
+            'post': Post,
+            'search': Search,
+            }
+
+
+## Dispatcher forwards requests according to the DISPATCH table.
+async def Dispatcher(scope, receive, send):
+    '''ASGI application; sends requests to handlers based on the first path component.'''
+    if scope['type'] == 'lifespan':
+        # close the pool when the server shuts down
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await forumdb_async.Close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    page = scope['path'].strip('/').split('/')[0]
+    if page in DISPATCH:
+        return await DISPATCH[page](scope, receive, send)
+    await _Send(send, 404, [('content-type', 'text/plain')], ('Not Found: ' + page).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Run the asyncio DB Forum server.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    args = parser.parse_args()
+
+    # Run this bad server only on localhost!
+    uvicorn.run(Dispatcher, host=args.host, port=args.port, log_level='warning')
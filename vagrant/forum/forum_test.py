@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+# Test cases for the web forum (forumdb, pages and pagecache).
+#
+# They run against the database of forumdb.DSN; posts they add carry the
+# MARKER prefix and are deleted again, other posts are left alone. Posts of
+# the keyset test are dated in the future, so they are the newest.
+#
+
+import datetime
+import os
+import threading
+import time
+
+import forumdb
+import pagecache
+from pages import FormatCursor, ParseCursor
+
+## Prefix of the content of every post the tests add
+MARKER = 'forum_test'
+
+
+def _CountPosts(prefix):
+    '''Return the no. of committed posts whose content starts with prefix.'''
+    with forumdb._Cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM posts WHERE content LIKE %s;", (prefix + '%',))
+        return cur.fetchone()[0]
+
+
+def _DeletePosts():
+    '''Delete the posts added by the tests.'''
+    with forumdb._Cursor() as cur:
+        cur.execute("DELETE FROM posts WHERE content LIKE %s;", (MARKER + '%',))
+
+
+def _Writers():
+    '''Return the no. of group commit writer threads of this process.'''
+    return sum(thread.name == 'forumdb-group-commit' for thread in threading.enumerate())
+
+
+def TestGroupCommit():
+    '''Test that with group commit every AddPost is committed by the time it returns.'''
+    _DeletePosts()
+    lost = []
+
+    def Post(i):
+        content = '%s group %d.' % (MARKER, i)
+        forumdb.AddPost(content)
+        # another connection has to see the post as soon as AddPost returns
+        if _CountPosts(content) != 1:
+            lost.append(content)
+
+    forumdb.EnableGroupCommit(max_batch=8, max_delay=0.002)
+    try:
+        threads = [threading.Thread(target=Post, args=(i,)) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        forumdb.DisableGroupCommit()
+    try:
+        if lost:
+            raise ValueError("Posts should be committed when AddPost returns: %s" % lost)
+        if _CountPosts(MARKER + ' group ') != 40:
+            raise ValueError("Every post should be stored exactly once.")
+        if _Writers() != 0:
+            raise ValueError("DisableGroupCommit should stop the writer thread.")
+    finally:
+        _DeletePosts()
+    print "1. Concurrent posts are committed together and none is lost."
+
+
+def TestGroupCommitStop():
+    '''Test that posts racing DisableGroupCommit are stored and their callers return.'''
+    _DeletePosts()
+    try:
+        for round_ in range(20):
+            forumdb.EnableGroupCommit(max_batch=4, max_delay=0.001)
+            threads = [threading.Thread(target=forumdb.AddPost, args=('%s stop %d %d' % (MARKER, round_, i),))
+                       for i in range(20)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            forumdb.DisableGroupCommit()
+            for thread in threads:
+                thread.join(10)
+            if any(thread.is_alive() for thread in threads):
+                raise ValueError("AddPost should return when group commit is disabled meanwhile.")
+        if _CountPosts(MARKER + ' stop ') != 20 * 20:
+            raise ValueError("Posts racing DisableGroupCommit should all be stored.")
+        if _Writers() != 0:
+            raise ValueError("No writer thread should be left after DisableGroupCommit.")
+
+        # a stopped committer refuses posts, AddPost inserts them itself
+        committer = forumdb._GroupCommitter(4, 0.001)
+        committer.Stop()
+        if committer.Add('%s stopped' % MARKER) is not False or _Writers() != 0:
+            raise ValueError("A stopped committer should refuse posts without starting a writer.")
+    finally:
+        _DeletePosts()
+    print "2. Posts racing the end of group commit are stored and their callers return."
+
+
+def TestPageCacheAcrossProcesses():
+    '''Test that a post added by a forked worker drops the pages cached by the others.'''
+    cache = pagecache.PageCache(max_age=None)
+    renders = []
+
+    def Render():
+        renders.append(1)
+        return 'page %d' % len(renders)
+
+    cache.Get('', Render)
+    if cache.Get('', Render)[1] != 'page 1':
+        raise ValueError("A cached page should be served without rendering it again.")
+    pid = os.fork()
+    if pid == 0:
+        # the worker that took the post
+        cache.Invalidate()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    if cache.Get('', Render)[1] != 'page 2':
+        raise ValueError("A post added by another worker should drop the cached pages.")
+    print "3. Pages cached by one worker are dropped when another one takes a post."
+
+
+def TestCursorRoundTrip():
+    '''Test that page cursors survive a trip through the URL, and that bad ones are ignored.'''
+    for cursor in ((datetime.datetime(2016, 2, 29, 23, 59, 59, 123456), 42),
+                   (datetime.datetime(2016, 3, 1, 0, 0, 0), 7),
+                   (datetime.datetime(2016, 3, 1, 0, 0, 0, 1), 2 ** 40)):
+        if ParseCursor('before=' + FormatCursor(cursor)) != cursor:
+            raise ValueError("ParseCursor should return the cursor FormatCursor encoded: %s" % (cursor,))
+        if ParseCursor('q=x&before=%s&page=2' % FormatCursor(cursor)) != cursor:
+            raise ValueError("The cursor should be found among other fields.")
+    for query in ('', 'page=2', 'before=', 'before=garbage', 'before=2016-03-01+00%3A00%3A00%2Cx',
+                  'before=2016-13-01+00%3A00%3A00%2C1', 'before=%2C5'):
+        if ParseCursor(query) is not None:
+            raise ValueError("A missing or malformed cursor should give the first page: %r" % query)
+    print "4. Page cursors survive the URL and malformed ones are ignored."
+
+
+def TestKeysetBoundaries():
+    '''Test that paging with GetPosts returns every post once, ties on time broken by id.'''
+    _DeletePosts()
+    times = ['2100-01-01 00:00:00'] * 7 + ['2100-01-01 00:00:00.5'] * 2 + ['2100-01-01 00:00:01']
+    try:
+        rows = []
+        with forumdb._Cursor() as cur:
+            for i, t in enumerate(times):
+                cur.execute("INSERT INTO posts(content, time) VALUES(%s, %s) RETURNING time, id;",
+                            ('%s keyset %d' % (MARKER, i), t))
+                rows.append(cur.fetchone() + ('%s keyset %d' % (MARKER, i),))
+        expected = [content for _, _, content in sorted(rows, reverse=True)]
+
+        # pages of 3 end in the middle of the posts with equal times
+        seen = []
+        before = None
+        while len(seen) < len(expected):
+            posts, next = forumdb.GetPosts(before, limit=3)
+            seen.extend(post['content'] for post in posts)
+            if next is None:
+                break
+            # like the next page link of the page
+            before = ParseCursor('before=' + FormatCursor(next))
+        if seen[:len(expected)] != expected:
+            raise ValueError("Pages should hold every post once, newest first, then highest id first: %s"
+                             % seen[:len(expected)])
+    finally:
+        _DeletePosts()
+    print "5. Paging returns every post once, even across posts with equal times."
+
+
+def TestPageCache():
+    '''Test that cached pages expire, carry their ETag, and are dropped when a post is added.'''
+    renders = []
+
+    def Render():
+        renders.append(1)
+        return 'page %d' % len(renders)
+
+    if pagecache.ETag('a') != pagecache.ETag('a') or pagecache.ETag('a') == pagecache.ETag('b') \
+            or not pagecache.ETag('a').startswith('"'):
+        raise ValueError("ETags should be quoted and differ exactly when the pages do.")
+
+    cache = pagecache.PageCache(max_age=0.05)
+    etag, html = cache.Get('', Render)
+    if cache.Get('', Render) != (etag, html) or etag != pagecache.ETag(html):
+        raise ValueError("A cached page should come back with the ETag of its html.")
+    time.sleep(0.1)
+    if cache.Get('', Render)[1] != 'page 2':
+        raise ValueError("A page older than max_age should be rendered again.")
+
+    cache = pagecache.PageCache(max_age=None)
+    cache.Get('', Render)
+    cache.Invalidate()
+    if cache.Get('', Render)[1] != 'page 4':
+        raise ValueError("Invalidate should drop the cached pages.")
+
+    def RenderAndPost():
+        # a post added while the page is rendered
+        cache.Invalidate()
+        return Render()
+
+    cache.Get('other', RenderAndPost)
+    if cache.Get('other', Render)[1] != 'page 6':
+        raise ValueError("A page rendered before a concurrent post should not be cached.")
+
+    cache = pagecache.PageCache(max_pages=2, max_age=None)
+    for key in ('a', 'b', 'c'):
+        cache.Get(key, Render)
+    if cache.Get('b', Render)[1] != 'page 8' or cache.Get('a', Render)[1] != 'page 10':
+        raise ValueError("The least recently used page should be evicted first.")
+    print "6. Cached pages expire, carry their ETag and are dropped when a post is added."
+
+
+if __name__ == '__main__':
+    TestGroupCommit()
+    TestGroupCommitStop()
+    TestPageCacheAcrossProcesses()
+    TestCursorRoundTrip()
+    TestKeysetBoundaries()
+    TestPageCache()
+    print "Success!  All tests pass!"
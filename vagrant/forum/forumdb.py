@@ -2,17 +2,101 @@
 # Database access functions for the web forum.
 # 
 
-import bleach
+import os
+import Queue
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+import sanitize
+import tracing
+
+## No. of posts shown per page
+PAGE_SIZE = 20
+
+## No. of posts fetched per round-trip when streaming
+STREAM_BATCH_SIZE = 500
+
+## Database connection settings; the pool opens up to POOL_MAX connections
+## as requests need them and keeps them open once returned
+DSN = "dbname=forum"
+POOL_MAX = 10
+
+## Connection pool, created on first use by the process that uses it
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# limits checkouts to POOL_MAX; ThreadedConnectionPool fails instead of waiting
+_pool_slots = None
+
+
+def _GetPool():
+    '''Return this process' connection pool, creating it if needed.'''
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        # a forked worker must not use the parent's connections
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = _LazyPool(POOL_MAX, DSN)
+            _pool_pid = os.getpid()
+            _pool_slots = threading.BoundedSemaphore(POOL_MAX)
+        return _pool, _pool_slots
+
 
-## Database connection
-conn = psycopg2.connect("dbname=forum")
+class _LazyPool(ThreadedConnectionPool):
+    '''ThreadedConnectionPool that opens no connection up front and keeps up
+    to maxconn connections idle, instead of closing every connection
+    returned while minconn are idle.'''
 
-# Open a cursor to perform database operations
-cur = conn.cursor()
+    def __init__(self, maxconn, *args, **kwargs):
+        ThreadedConnectionPool.__init__(self, 0, maxconn, *args, **kwargs)
+        # putconn() closes a returned connection once minconn are idle
+        self.minconn = maxconn
+
+
+@contextmanager
+def _Cursor(name=None):
+    '''Yield a cursor on a pooled connection for the duration of one call.
+
+    The transaction is committed if the block succeeds and rolled back
+    otherwise; either way the connection goes back to the pool.
+
+    Args:
+      name: name of a server-side cursor, None for a client-side one.
+    '''
+    pool, slots = _GetPool()
+    slots.acquire()
+    try:
+        conn = pool.getconn()
+        try:
+            if tracing.IsEnabled():
+                cur = conn.cursor(name, cursor_factory=tracing.TracingCursor)
+            else:
+                cur = conn.cursor(name)
+            try:
+                yield cur
+            finally:
+                cur.close()
+            conn.commit()
+        except:
+            # don't hand out a connection that was lost mid-transaction
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except psycopg2.Error:
+                pass
+            pool.putconn(conn, close=bool(conn.closed))
+            raise
+        pool.putconn(conn)
+    finally:
+        slots.release()
 
 
 ## Get posts from database.
+@tracing.Traced
 def GetAllPosts():
     '''Get all the posts from the database, sorted with the newest first.
 
@@ -25,11 +109,12 @@ def GetAllPosts():
     # select stmn
     sql = "SELECT content, time FROM posts ORDER BY time DESC;"
 
-    # Query the database and obtain data as Python objects
-    cur.execute(sql)
+    with _Cursor() as cur:
+        # Query the database and obtain data as Python objects
+        cur.execute(sql)
 
-    # fetch all
-    resultSet = cur.fetchall()
+        # fetch all
+        resultSet = cur.fetchall()
 
     posts = [{'content': str(row[0]), 'time': str(row[1])} for row in resultSet]
     # no need to sort as result set is sorted by time
@@ -39,7 +124,116 @@ def GetAllPosts():
     return posts
 
 
+## Get one page of posts from database.
+@tracing.Traced
+def GetPosts(before=None, limit=PAGE_SIZE):
+    '''Get a page of posts from the database, sorted with the newest first.
+
+    Pages are addressed by the (time, id) of the last post of the previous
+    page rather than by offset, so any page is read straight off the
+    (time DESC, id DESC) index no matter how many posts there are.
+
+    Args:
+      before: (time, id) cursor; only posts older than it are returned.
+        None for the first page.
+      limit: max no. of posts in the page.
+
+    Returns:
+      A tuple (posts, next) where posts is a list of dictionaries like the
+      ones returned by GetAllPosts, and next the cursor of the following
+      page, or None if this is the last page.
+    '''
+
+    # select stmn; fetch one extra row to know if there is a next page
+    if before is None:
+        sql = "SELECT content, time, id FROM posts ORDER BY time DESC, id DESC LIMIT %s;"
+        params = (limit + 1,)
+    else:
+        sql = "SELECT content, time, id FROM posts WHERE (time, id) < (%s, %s) " \
+              "ORDER BY time DESC, id DESC LIMIT %s;"
+        params = (before[0], before[1], limit + 1)
+
+    with _Cursor() as cur:
+        cur.execute(sql, params)
+        resultSet = cur.fetchall()
+
+    next = None
+    if len(resultSet) > limit:
+        resultSet = resultSet[:limit]
+        next = (resultSet[-1][1], resultSet[-1][2])
+
+    posts = [{'content': str(row[0]), 'time': str(row[1])} for row in resultSet]
+    return posts, next
+
+
+## Stream all posts from database.
+def IterPosts(batch_size=STREAM_BATCH_SIZE):
+    '''Iterate over all the posts in the database, newest first, without
+    loading them all into memory.
+
+    Rows are read through a server-side (named) cursor, batch_size at a time.
+    Close the iterator if it is not consumed to the end.
+
+    Yields:
+      Lists of at most batch_size dictionaries like the ones returned by
+      GetAllPosts.
+    '''
+
+    # select stmn
+    sql = "SELECT content, time FROM posts ORDER BY time DESC, id DESC;"
+
+    # named cursor keeps the result set on the server
+    with _Cursor('forumdb_iter_posts') as stream:
+        stream.execute(sql)
+        while True:
+            resultSet = stream.fetchmany(batch_size)
+            if not resultSet:
+                break
+            yield [{'content': str(row[0]), 'time': str(row[1])} for row in resultSet]
+
+
+## Search posts in database.
+@tracing.Traced
+def SearchPosts(query, page=0, limit=PAGE_SIZE):
+    '''Get a page of the posts matching a full-text search, best match first.
+
+    Matching posts are found through the GIN index on posts.search, so only
+    they are read and ranked, not the whole table.
+
+    Args:
+      query: the words to search for; all of them must appear in a post.
+      page: no. of the page, starting from 0.
+      limit: max no. of posts in the page.
+
+    Returns:
+      A tuple (posts, next) where posts is a list of dictionaries like the
+      ones returned by GetAllPosts, and next the no. of the following page,
+      or None if this is the last page.
+    '''
+    # nothing to search for
+    if not query.strip():
+        return [], None
+
+    # select stmn; fetch one extra row to know if there is a next page
+    sql = "SELECT content, time FROM posts, plainto_tsquery('english', %s) query " \
+          "WHERE search @@ query ORDER BY ts_rank(search, query) DESC, id DESC " \
+          "LIMIT %s OFFSET %s;"
+
+    with _Cursor() as cur:
+        cur.execute(sql, (query, limit + 1, page * limit))
+        resultSet = cur.fetchall()
+
+    next = None
+    if len(resultSet) > limit:
+        resultSet = resultSet[:limit]
+        next = page + 1
+
+    posts = [{'content': str(row[0]), 'time': str(row[1])} for row in resultSet]
+    return posts, next
+
+
 ## Add a post to the database.
+@tracing.Traced
 def AddPost(content):
     '''Add a new post to the database.
 
@@ -54,11 +248,132 @@ def AddPost(content):
 
     # use bleach to
     # escapes or strips markup and attributes
-    content = bleach.clean(content)
+    content = sanitize.Clean(content)
+
+    # under bursts, share one commit with concurrent posts
+    committer = _committer
+    if committer is not None and committer.Add(content):
+        return
+
+    # exe insert statement; the change is made
+    # persistent when the block commits
+    with _Cursor() as cur:
+        # use tuple to avoid db injection issues
+        cur.execute(sql, (content,))
+
+
+## Group commit for AddPost
+_committer = None
+
+
+def EnableGroupCommit(max_batch=100, max_delay=0.005):
+    '''Make AddPost share commits between concurrent callers.
+
+    Posts are queued and written by one writer thread as a single multi-row
+    insert per transaction, once max_batch posts are waiting or max_delay
+    seconds after the first one arrived. AddPost still returns only after
+    the transaction holding its post has committed.
+    '''
+    global _committer
+    DisableGroupCommit()
+    _committer = _GroupCommitter(max_batch, max_delay)
+
+
+def DisableGroupCommit():
+    '''Go back to one commit per AddPost, after flushing queued posts.'''
+    global _committer
+    committer, _committer = _committer, None
+    if committer is not None:
+        committer.Stop()
+
+
+class _GroupCommitter(object):
+    '''Queue of posts flushed by a writer thread in batches.'''
+
+    def __init__(self, max_batch, max_delay):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._stopped = False
+
+    def Add(self, content):
+        '''Queue a post and wait until it is committed.
+
+        Returns False, without queueing the post, once Stop() was called; the
+        caller has to insert it itself.
+        '''
+        # [content, done, error]
+        item = [content, threading.Event(), None]
+        # checked and queued under the lock Stop() queues the writer's
+        # sentinel under, so no post can end up behind it
+        with self._lock:
+            if self._stopped:
+                return False
+            self._Start()
+            self._queue.put(item)
+        # wait() without timeout can't be interrupted in Python 2
+        while not item[1].wait(60):
+            pass
+        if item[2] is not None:
+            raise item[2]
+        return True
+
+    def Stop(self):
+        '''Flush queued posts and stop the writer thread; later posts are
+        refused by Add().'''
+        with self._lock:
+            self._stopped = True
+            writer = self._writer
+            self._writer = None
+            stop = writer is not None and self._writer_pid == os.getpid()
+            if stop:
+                self._queue.put(None)
+        if stop:
+            writer.join()
+
+    def _Start(self):
+        '''Start the writer thread if needed; called with _lock held.'''
+        # threads don't survive fork; start a writer per process
+        if self._writer is None or self._writer_pid != os.getpid():
+            if self._writer_pid != os.getpid():
+                self._queue = Queue.Queue()
+            self._writer = threading.Thread(target=self._Run, name='forumdb-group-commit')
+            self._writer.daemon = True
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _Run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+
+            # collect more posts until the batch is full or the delay is over
+            deadline = time.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.time()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
 
-    # exe insert statement
-    # use tuple to avoid db injection issues
-    cur.execute(sql, (content,))
+            try:
+                with _Cursor() as cur:
+                    execute_values(cur, "INSERT INTO posts(content) VALUES %s;",
+                                   [(content,) for content, _, _ in batch])
+            except Exception as e:
+                for item in batch:
+                    item[2] = e
 
-    # Make the changes to the database persistent
-    conn.commit()
+            # commit is done (or failed); wake up the callers
+            for item in batch:
+                item[1].set()
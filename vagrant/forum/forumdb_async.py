@@ -0,0 +1,145 @@
+#
+# Async database access functions for the web forum (Python 3, asyncpg).
+#
+# Same queries as forumdb, on a pool of asyncpg connections so that one
+# process can serve many slow clients without a thread per connection.
+#
+
+import asyncio
+
+import asyncpg
+
+import sanitize
+
+## No. of posts shown per page
+PAGE_SIZE = 20
+
+## No. of posts fetched per round-trip when streaming
+STREAM_BATCH_SIZE = 500
+
+## Database connection settings
+DSN = "postgresql:///forum"
+POOL_MIN = 4
+POOL_MAX = 20
+
+## Connection pool, created on first use inside the running event loop
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def _GetPool():
+    '''Return the connection pool, creating it if needed.'''
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(DSN, min_size=POOL_MIN, max_size=POOL_MAX)
+        return _pool
+
+
+async def Close():
+    '''Close the connection pool; call on application shutdown.'''
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+def _Post(row):
+    return {'content': str(row['content']), 'time': str(row['time'])}
+
+
+## Get posts from database.
+async def GetAllPosts():
+    '''Get all the posts from the database, sorted with the newest first.
+
+    Returns:
+      A list of dictionaries, see forumdb.GetAllPosts.
+    '''
+    pool = await _GetPool()
+    rows = await pool.fetch("SELECT content, time FROM posts ORDER BY time DESC;")
+    return [_Post(row) for row in rows]
+
+
+## Get one page of posts from database.
+async def GetPosts(before=None, limit=PAGE_SIZE):
+    '''Get a page of posts from the database, sorted with the newest first.
+
+    Returns:
+      A tuple (posts, next), see forumdb.GetPosts.
+    '''
+    pool = await _GetPool()
+    # fetch one extra row to know if there is a next page
+    if before is None:
+        rows = await pool.fetch("SELECT content, time, id FROM posts "
+                                "ORDER BY time DESC, id DESC LIMIT $1;", limit + 1)
+    else:
+        rows = await pool.fetch("SELECT content, time, id FROM posts WHERE (time, id) < ($1, $2) "
+                                "ORDER BY time DESC, id DESC LIMIT $3;", before[0], before[1], limit + 1)
+
+    next = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next = (rows[-1]['time'], rows[-1]['id'])
+
+    return [_Post(row) for row in rows], next
+
+
+## Stream all posts from database.
+async def IterPosts(batch_size=STREAM_BATCH_SIZE):
+    '''Iterate over all the posts in the database, newest first, without
+    loading them all into memory.
+
+    Yields:
+      Lists of at most batch_size dictionaries, see forumdb.IterPosts.
+    '''
+    pool = await _GetPool()
+    async with pool.acquire() as conn:
+        # server-side cursors live in a transaction
+        async with conn.transaction():
+            cursor = await conn.cursor("SELECT content, time FROM posts ORDER BY time DESC, id DESC;")
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield [_Post(row) for row in rows]
+
+
+## Search posts in database.
+async def SearchPosts(query, page=0, limit=PAGE_SIZE):
+    '''Get a page of the posts matching a full-text search, best match first.
+
+    Returns:
+      A tuple (posts, next), see forumdb.SearchPosts.
+    '''
+    # nothing to search for
+    if not query.strip():
+        return [], None
+
+    pool = await _GetPool()
+    # fetch one extra row to know if there is a next page
+    rows = await pool.fetch("SELECT content, time FROM posts, plainto_tsquery('english', $1) query "
+                            "WHERE search @@ query ORDER BY ts_rank(search, query) DESC, id DESC "
+                            "LIMIT $2 OFFSET $3;", query, limit + 1, page * limit)
+
+    next = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next = page + 1
+
+    return [_Post(row) for row in rows], next
+
+
+## Add a post to the database.
+async def AddPost(content):
+    '''Add a new post to the database.
+
+    Args:
+      content: The text content of the new post.
+    '''
+    # use bleach to
+    # escapes or strips markup and attributes
+    content = sanitize.Clean(content)
+
+    pool = await _GetPool()
+    await pool.execute("INSERT INTO posts(content) VALUES($1);", content)
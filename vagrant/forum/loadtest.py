@@ -0,0 +1,111 @@
+#
+# Local load test of the forum server in each serving mode.
+#
+# Starts forum.py once per mode, sends GET / from concurrent clients for a
+# fixed time and reports requests per second and p50/p99 latency:
+#
+#   python loadtest.py --clients 16 --duration 10
+#   python loadtest.py --modes threaded prefork --workers 8
+#
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib2
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def StartServer(mode, port, workers):
+    '''Start forum.py in a subprocess and wait until it accepts connections.'''
+    devnull = open(os.devnull, 'w')
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'forum.py'),
+                               '--host', '127.0.0.1', '--port', str(port),
+                               '--mode', mode, '--workers', str(workers)],
+                              stdout=devnull, stderr=devnull)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('forum.py (%s) did not start' % mode)
+
+
+def Load(url, clients, duration):
+    '''Send requests to url from clients threads for duration seconds.
+
+    Returns:
+      A tuple (latencies, errors), latencies in seconds.
+    '''
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def Client():
+        mine = []
+        failed = 0
+        while time.time() < deadline:
+            start = time.time()
+            try:
+                urllib2.urlopen(url, timeout=30).read()
+                mine.append(time.time() - start)
+            except Exception:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=Client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def Percentile(values, fraction):
+    '''Return the value below which fraction of the sorted values fall.'''
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the forum server.')
+    parser.add_argument('--modes', nargs='+', default=['single', 'threaded', 'prefork'],
+                        choices=('single', 'threaded', 'prefork'))
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per mode')
+    parser.add_argument('--workers', type=int, default=4, help='processes in prefork mode')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--path', default='/', help='path to request')
+    args = parser.parse_args()
+
+    print '%-10s %10s %10s %10s %8s' % ('mode', 'req/s', 'p50 (ms)', 'p99 (ms)', 'errors')
+    for mode in args.modes:
+        server = StartServer(mode, args.port, args.workers)
+        try:
+            url = 'http://127.0.0.1:%d%s' % (args.port, args.path)
+            latencies, errors = Load(url, args.clients, args.duration)
+        finally:
+            # graceful shutdown
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        latencies.sort()
+        print '%-10s %10.1f %10.2f %10.2f %8d' % (mode, len(latencies) / args.duration,
+                                                  1000 * Percentile(latencies, 0.50),
+                                                  1000 * Percentile(latencies, 0.99),
+                                                  errors)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#
+# Cache of rendered forum pages.
+#
+
+import hashlib
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+
+
+class PageCache(object):
+    '''Rendered HTML pages keyed by their URL query, with ETags.
+
+    Every page is dropped when a post is added (see Invalidate), in this
+    process and in the processes forked from the one that created the cache
+    (forum.py's prefork workers), which share its generation counter.
+    Entries also expire after max_age seconds, which bounds how long a page
+    stays stale when an unrelated server process adds the post.
+    '''
+
+    def __init__(self, max_pages=256, max_age=5.0, enabled=True):
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # key -> (etag, html, time rendered), least recently used first
+        self._pages = OrderedDict()
+        # bumped by Invalidate; in shared memory, so forked workers see it
+        self._generation = multiprocessing.Value('l', 0)
+        # generation the cached pages of this process were rendered in
+        self._pages_generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+
+    def Get(self, key, render):
+        '''Return (etag, html) of a page, rendering it with render() on a miss.'''
+        if not self.enabled:
+            html = render()
+            return ETag(html), html
+
+        generation = self._generation.value
+        with self._lock:
+            # another process added a post
+            if generation != self._pages_generation:
+                self._pages.clear()
+                self._pages_generation = generation
+            page = self._pages.pop(key, None)
+            if page is not None and (self.max_age is None or time.time() - page[2] <= self.max_age):
+                self._pages[key] = page
+                self._hits += 1
+                return page[0], page[1]
+            self._misses += 1
+
+        html = render()
+        etag = ETag(html)
+
+        with self._lock:
+            # don't store a page rendered before a concurrent Invalidate
+            if generation == self._generation.value == self._pages_generation:
+                self._pages[key] = (etag, html, time.time())
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+        return etag, html
+
+    def Invalidate(self):
+        '''Drop every cached page; called whenever a post is added.'''
+        with self._generation.get_lock():
+            self._generation.value += 1
+        with self._lock:
+            self._pages.clear()
+
+    def NotModified(self):
+        '''Count a request answered with 304 Not Modified.'''
+        with self._lock:
+            self._not_modified += 1
+
+    def Stats(self):
+        '''Return a dictionary of cache counters.'''
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses,
+                    'not_modified': self._not_modified, 'pages': len(self._pages)}
+
+
+def ETag(html):
+    '''Strong ETag of a rendered page.'''
+    return '"%s"' % hashlib.md5(html).hexdigest()
@@ -0,0 +1,132 @@
+#
+# HTML templates and page cursors of the web forum, shared by the WSGI app
+# (forum.py, Python 2) and the asyncio app (forum_async.py, Python 3).
+#
+
+import datetime
+from xml.sax.saxutils import escape
+
+try:
+    from urllib import quote_plus
+    from urlparse import parse_qs
+except ImportError:
+    from urllib.parse import quote_plus, parse_qs
+
+# HTML template for the forum page
+HTML_WRAP = '''\
+<!DOCTYPE html>
+<html>
+  <head>
+    <title>DB Forum</title>
+    <style>
+      h1, form { text-align: center; }
+      textarea { width: 400px; height: 100px; }
+      div.post { border: 1px solid #999;
+                 padding: 10px 10px;
+		 margin: 10px 20%%; }
+      hr.postbound { width: 50%%; }
+      em.date { color: #999 }
+      div.pager { text-align: center; }
+    </style>
+  </head>
+  <body>
+    <h1>DB Forum</h1>
+    <form method=get action="/search">
+      <input name="q" value="%(q)s"> <button type="submit">Search</button>
+    </form>
+    <form method=post action="/post">
+      <div><textarea id="content" name="content"></textarea></div>
+      <div><button id="go" type="submit">Post message</button></div>
+    </form>
+    <!-- post content will go here -->
+%(content)s
+  </body>
+</html>
+'''
+
+# HTML template for an individual comment
+POST = '''\
+    <div class=post><em class=date>%(time)s</em><br>%(content)s</div>
+'''
+
+# the page around the posts, for sending it in pieces
+HTML_HEAD, HTML_TAIL = (HTML_WRAP % {'q': '', 'content': '%s'}).split('%s')
+
+# HTML template for the link to the next (older) page of posts
+NEXT_PAGE = '''\
+    <div class=pager><a href="/?before=%(before)s">Older posts</a></div>
+'''
+
+# HTML template for the link to the next page of search results
+NEXT_RESULTS = '''\
+    <div class=pager><a href="/search?q=%(q)s&amp;page=%(page)d">More results</a></div>
+'''
+
+
+## Render one page of posts
+def RenderPage(posts, next):
+    '''Return the HTML of a page of posts.
+
+    Args:
+      posts: list of dictionaries with 'content' and 'time' keys.
+      next: cursor of the following page, or None on the last page.
+    '''
+    content = ''.join(POST % p for p in posts)
+    if next is not None:
+        content += NEXT_PAGE % {'before': FormatCursor(next)}
+    return HTML_WRAP % {'q': '', 'content': content}
+
+
+## Render one page of search results
+def RenderResults(q, posts, next):
+    '''Return the HTML of a page of search results.
+
+    Args:
+      q: the search query, shown in the search box.
+      posts: list of dictionaries with 'content' and 'time' keys.
+      next: no. of the following page, or None on the last page.
+    '''
+    content = ''.join(POST % p for p in posts)
+    if next is not None:
+        content += NEXT_RESULTS % {'q': quote_plus(q), 'page': next}
+    return HTML_WRAP % {'q': escape(q, {'"': '&quot;'}), 'content': content}
+
+
+## Page cursors are passed in the query string as before=<time>,<id>
+def FormatCursor(cursor):
+    '''Encode a (time, id) page cursor for use in a URL.'''
+    return quote_plus('%s,%d' % (cursor[0], cursor[1]))
+
+
+def ParseCursor(query):
+    '''Decode the page cursor of a query string.
+
+    Returns:
+      A (time, id) tuple, or None for the first page or a malformed cursor.
+    '''
+    fields = parse_qs(query)
+    if 'before' not in fields:
+        return None
+    time, _, id = fields['before'][0].rpartition(',')
+    if not id.isdigit():
+        return None
+    # str() of a timestamp leaves out the fraction when it is zero
+    for format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return (datetime.datetime.strptime(time, format), int(id))
+        except ValueError:
+            pass
+    return None
+
+
+## Searches are passed in the query string as q=<words>&page=<no.>
+def ParseSearch(query):
+    '''Decode the search and page no. of a query string.
+
+    Returns:
+      A (q, page) tuple; page is 0 when missing or malformed.
+    '''
+    fields = parse_qs(query)
+    q = fields.get('q', [''])[0]
+    page = fields.get('page', ['0'])[0]
+    return q, int(page) if page.isdigit() else 0
@@ -0,0 +1,53 @@
+#
+# Memoized bleach.clean for the web forum (forumdb and forumdb_async).
+#
+# Same approach and cache as the tournament app's sanitize.py: the LRU
+# cache is the tournament's cache.LRUCache, loaded through shared.py.
+#
+
+import re
+import threading
+
+import bleach
+
+import shared
+
+## Max no. of sanitized strings remembered
+CACHE_SIZE = 4096
+
+# characters bleach.clean may change: markup and entities, and the control
+# characters it strips or normalizes ('\r', NUL, ...)
+_NEEDS_CLEANING = re.compile(u'[<>&\x00-\x08\x0b-\x1f\x7f-\x9f]')
+
+# input -> bleach.clean(input)
+_cache = shared.Load('cache').LRUCache(maxsize=CACHE_SIZE)
+
+_lock = threading.Lock()
+_bypassed = [0]
+
+
+def Clean(text):
+    '''Escape or strip markup and attributes, like bleach.clean(text).
+
+    Text bleach would return unchanged skips the HTML parser, and repeated
+    input is served from a bounded LRU cache.
+    '''
+    if not _NEEDS_CLEANING.search(text):
+        with _lock:
+            _bypassed[0] += 1
+        return text
+
+    cleaned = _cache.get(text)
+    if cleaned is None:
+        cleaned = bleach.clean(text)
+        _cache.put(text, cleaned)
+    return cleaned
+
+
+def Stats():
+    '''Return a dictionary of counters: bypassed, and hits, misses,
+    hit_rate and size of the cache.'''
+    stats = _cache.stats()
+    with _lock:
+        stats['bypassed'] = _bypassed[0]
+    return stats
@@ -0,0 +1,35 @@
+#
+# Modules the web forum shares with the tournament app (../tournament).
+#
+# Load() imports one of them under a private name, '_tournament_<name>', so
+# it can't shadow or be shadowed by a top-level module of the same name
+# (the forum has its own tracing and sanitize). Works under Python 2
+# (forum.py) and 3 (forum_async.py).
+#
+
+import os
+import sys
+
+## Directory of the tournament app
+TOURNAMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tournament')
+
+
+def Load(name):
+    '''Return the tournament app's module name, loading it on first use.'''
+    private_name = '_tournament_' + name
+    module = sys.modules.get(private_name)
+    if module is not None:
+        return module
+
+    path = os.path.join(TOURNAMENT_DIR, name + '.py')
+    try:
+        from importlib.util import module_from_spec, spec_from_file_location
+    except ImportError:
+        ## Python 2 has no importlib.util
+        import imp
+        return imp.load_source(private_name, path)
+    spec = spec_from_file_location(private_name, path)
+    module = module_from_spec(spec)
+    sys.modules[private_name] = module
+    spec.loader.exec_module(module)
+    return module
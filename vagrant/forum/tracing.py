@@ -0,0 +1,40 @@
+#
+# Opt-in query tracing for the web forum (forumdb and forum.py).
+#
+# The tracer is the one of the tournament app, ../tournament/tracing.py,
+# loaded through shared.py; this module gives it the forum's naming.
+# Off by default; Enable(), FORUM_TRACE=1 in the environment or
+# forum.py --trace turn it on. While on, every statement forumdb sends is
+# timed and counted per statement template and per chain of traced calls
+# that issued it, e.g. "View > GetPosts". Export with Report() (text) or
+# Metrics() (Prometheus text format, served by forum.py at /metrics).
+#
+# Counters are kept per process; in prefork mode each worker reports its own.
+#
+
+import os
+
+import shared
+
+_tracing = shared.Load('tracing')
+
+## Only FORUM_TRACE turns tracing on, not the tournament's TOURNAMENT_TRACE
+if os.environ.get('FORUM_TRACE') == '1':
+    _tracing.enable()
+else:
+    _tracing.disable()
+
+Enable = _tracing.enable
+Disable = _tracing.disable
+IsEnabled = _tracing.isEnabled
+Reset = _tracing.reset
+Traced = _tracing.traced
+TracingCursor = _tracing.TracingCursor
+Stats = _tracing.stats
+Report = _tracing.report
+
+
+def Metrics(prefix='forum'):
+    '''The counters in the Prometheus text exposition format, see
+    tournament/tracing.py metrics().'''
+    return _tracing.metrics(prefix)
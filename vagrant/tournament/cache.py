@@ -0,0 +1,71 @@
+#
+# cache.py -- small in-process LRU cache with time-to-live for tournament.py
+#
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping holding at most `maxsize` entries. The least recently
+    used entry is evicted first and entries older than `ttl` seconds are
+    treated as missing.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Args:
+            maxsize: max no. of entries kept.
+            ttl: seconds an entry stays valid, None to keep it until evicted.
+        """
+        if maxsize < 1:
+            raise ValueError("Invalid cache size: %s" % maxsize)
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, time stored), least recently used first
+        self._data = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value of key, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or (self.ttl is not None and time.time() - entry[1] > self.ttl):
+                self._misses += 1
+                return default
+            # re-insert as most recently used
+            self._data[key] = entry
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time())
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry; counters are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns: dict with hits, misses, hit_rate (0.0 - 1.0) and size.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {'hits': self._hits, 'misses': self._misses,
+                    'hit_rate': float(self._hits) / lookups if lookups else 0.0,
+                    'size': len(self._data)}
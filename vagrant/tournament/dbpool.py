@@ -0,0 +1,242 @@
+#
+# dbpool.py -- process-wide PostgreSQL connection pool for tournament.py
+#
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait timeout."""
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A small thread-safe connection pool.
+
+    Connections are created lazily with the `connect` factory up to `maxconn`,
+    kept open between statements and handed back to callers LIFO so that the
+    warmest connection is reused first. Idle connections above `minconn` are
+    closed once they have been unused for `idle_timeout` seconds, and
+    connections idle for more than `check_after` seconds are checked before
+    they are handed out.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, idle_timeout=300.0,
+                 check_on_checkout=True, check_after=30.0, wait_timeout=30.0):
+        """
+        Args:
+            connect: callable returning a new DB-API connection.
+            minconn: number of idle connections never reaped by idle_timeout.
+            maxconn: maximum number of connections open at the same time.
+            idle_timeout: seconds an idle connection may stay open, None to disable.
+            check_on_checkout: run a cheap query on checkout and replace
+             the connection if it is broken.
+            check_after: seconds a connection has to be idle before it is
+             checked on checkout; connections used more recently are trusted,
+             which spares a round trip on every call of a busy pool.
+            wait_timeout: seconds to wait for a free connection before
+             raising PoolTimeout, None to wait forever.
+        """
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: minconn=%s, maxconn=%s" % (minconn, maxconn))
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.check_on_checkout = check_on_checkout
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+
+        self._cond = threading.Condition(threading.Lock())
+        # list of (connection, time it was returned), most recent last
+        self._idle = []
+        # no. of connections currently open (idle + checked out)
+        self._size = 0
+        # ids of connections currently checked out
+        self._checkedout = set()
+        # pid that owns the connections; sockets must not be shared after fork
+        self._pid = os.getpid()
+        self._closed = False
+
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'wait_time': 0.0,
+                       'timeouts': 0, 'checks': 0, 'discarded': 0, 'reaped': 0}
+
+    def getconn(self):
+        """Check a connection out of the pool, opening a new one if needed."""
+        self._cond.acquire()
+        try:
+            self._checkPid()
+            if self._closed:
+                raise RuntimeError("Connection pool is closed.")
+            self._reap()
+
+            waited = None
+            while not self._idle and self._size >= self.maxconn:
+                # pool exhausted; wait for a connection to be returned
+                if waited is None:
+                    waited = time.time()
+                    self._stats['waits'] += 1
+                remaining = None
+                if self.wait_timeout is not None:
+                    remaining = self.wait_timeout - (time.time() - waited)
+                    if remaining <= 0:
+                        self._stats['wait_time'] += time.time() - waited
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout("No connection available after %.1fs." % self.wait_timeout)
+                self._cond.wait(remaining)
+            if waited is not None:
+                self._stats['wait_time'] += time.time() - waited
+
+            check = False
+            if self._idle:
+                conn, returned = self._idle.pop()
+                self._stats['hits'] += 1
+                check = self.check_on_checkout and time.time() - returned > self.check_after
+                if check:
+                    self._stats['checks'] += 1
+            else:
+                # reserve the slot before releasing the lock
+                conn = None
+                self._size += 1
+                self._stats['misses'] += 1
+        finally:
+            self._cond.release()
+
+        if check and not self._isHealthy(conn):
+            # broken connection; replace it, keeping its slot
+            self._close(conn)
+            self._cond.acquire()
+            try:
+                self._stats['discarded'] += 1
+            finally:
+                self._cond.release()
+            conn = None
+
+        if conn is None:
+            conn = self._open()
+
+        self._cond.acquire()
+        try:
+            self._checkedout.add(id(conn))
+        finally:
+            self._cond.release()
+        return conn
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection to the pool.
+        Args:
+            conn: connection obtained from getconn().
+            close: close the connection instead of keeping it, e.g. after an error
+             that left it in an unknown state.
+        """
+        self._cond.acquire()
+        try:
+            self._checkPid()
+            if id(conn) not in self._checkedout:
+                # connection was checked out by a parent process before fork;
+                # leave its socket alone
+                return
+            self._checkedout.discard(id(conn))
+            if close or self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        self._cond.acquire()
+        try:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """
+        Returns: dict of pool counters.
+            hits: checkouts served by an idle connection
+            misses: checkouts that had to open a new connection
+            waits: checkouts that blocked because the pool was exhausted
+            wait_time: total seconds spent blocked
+            timeouts: checkouts that gave up after wait_timeout
+            checks: checkouts that ran the health check
+            discarded: connections dropped by the health check
+            reaped: idle connections closed by idle_timeout
+            size: connections currently open
+            idle: connections currently idle
+        """
+        self._cond.acquire()
+        try:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            return stats
+        finally:
+            self._cond.release()
+
+    def _open(self):
+        # open a new connection for a slot already reserved in self._size
+        try:
+            conn = self._connect()
+        except Exception:
+            self._cond.acquire()
+            try:
+                self._size -= 1
+                self._cond.notify()
+            finally:
+                self._cond.release()
+            raise
+        return conn
+
+    def _discard(self, conn):
+        # close conn and free its slot (lock held)
+        self._close(conn)
+        self._size -= 1
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _isHealthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reap(self):
+        # close connections idle for longer than idle_timeout (lock held)
+        if self.idle_timeout is None:
+            return
+        deadline = time.time() - self.idle_timeout
+        # idle list is ordered by return time, oldest first
+        while len(self._idle) > self.minconn and self._idle[0][1] < deadline:
+            conn, _ = self._idle.pop(0)
+            self._discard(conn)
+            self._stats['reaped'] += 1
+
+    def _checkPid(self):
+        # after fork the child must not reuse the parent's sockets (lock held)
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._idle = []
+            self._checkedout = set()
+            self._size = 0
@@ -0,0 +1,282 @@
+#
+# pairing.py -- Swiss pairing engine used by tournament.swissPairings()
+#
+import random
+from array import array
+
+import networkx as nx
+
+# search steps allowed per player before a group falls back to blossom matching
+BACKTRACK_STEPS_PER_PLAYER = 20
+
+
+def pairKey(first_player_id, second_player_id):
+    """
+    Returns: an int identifying the unordered pair of players, used as
+     member of the played pairs set (cheaper to hash and store than a
+     frozenset of two ids).
+    """
+    if first_player_id > second_player_id:
+        first_player_id, second_player_id = second_player_id, first_player_id
+    return (first_player_id << 32) | second_player_id
+
+
+class PlayerTable(object):
+    """
+    Compact representation of grouped standings for pairing.
+
+    Ids, wins and matches are held in parallel int arrays and names in a
+    separate list; a player is referred to by its index into them. Players
+    of a score group occupy a contiguous range of indices.
+    """
+
+    def __init__(self, players_group):
+        """
+        Args:
+            players_group: list of groups, each a list of (id, name, wins, matches)
+             tuples, highest score group first.
+        """
+        rows = [player for group in players_group for player in group]
+
+        self.ids = array('l', [player[0] for player in rows])
+        self.names = [player[1] for player in rows]
+        self.wins = array('l', [player[2] for player in rows])
+        self.matches = array('l', [player[3] for player in rows])
+
+        # index of the first player of every group, plus the total count
+        self.bounds = array('l', [0])
+        for group in players_group:
+            self.bounds.append(self.bounds[-1] + len(group))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def groups(self):
+        """Returns: list of xrange objects, the indices of every score group."""
+        return [xrange(self.bounds[idx], self.bounds[idx + 1]) for idx in xrange(len(self.bounds) - 1)]
+
+    def named(self, pairs):
+        """
+        Args:
+            pairs: list of (idx1, idx2) index pairs.
+
+        Returns: list of (id1, name1, id2, name2) tuples.
+        """
+        ids = self.ids
+        names = self.names
+        return [(ids[first], names[first], ids[second], names[second]) for first, second in pairs]
+
+
+def pairGroups(players_group, played_pairs):
+    """
+    Pair players group by group, from the highest score group down.
+
+    Each group is paired with a greedy search that backtracks when it runs
+    into players who have already met. Players that cannot be paired inside
+    their group (the odd player out, or players whose remaining opponents
+    were all met before) float down and are paired first in the next group.
+    Only groups where the bounded search fails are handed to the blossom
+    algorithm (networkx max_weight_matching).
+    When players are still left over after the last group, the pairs of the
+    groups above are undone one group at a time and paired again together
+    with the leftovers, until everybody (but the odd player out) is paired.
+    Args:
+        players_group: list of groups, each a list of (id, name, wins, matches)
+         tuples, highest score group first.
+        played_pairs: set of pairKey() values of players who have already
+         played each other.
+
+    Returns:
+        A list of tuples, each of which contains (id1, name1, id2, name2).
+        A player is left unpaired only if the no. of players is odd, or if
+        no pairing of all of them avoids a rematch.
+    """
+    table = PlayerTable(players_group)
+    return table.named(pairTable(table, played_pairs))
+
+
+def pairTable(table, played_pairs):
+    """
+    Pair the players of a PlayerTable, see pairGroups().
+    Args:
+        table: PlayerTable.
+        played_pairs: set of pairKey() values of players who have already
+         played each other.
+
+    Returns: list of (idx1, idx2) index pairs into table.
+    """
+    # pairs made in every group, and the players the group paired them from
+    group_pairs = []
+    group_players = []
+
+    # players floated down from higher groups
+    floaters = []
+
+    for group in table.groups():
+        # shuffle so that pairings are not always the same,
+        # floaters keep their place at the front
+        group = list(group)
+        random.shuffle(group)
+        players = floaters + group
+
+        matched = _pairPlayers(table.ids, players, played_pairs)
+        group_pairs.append(matched)
+        group_players.append(players)
+        floaters = _unpaired(players, matched)
+
+    # leftovers of the last group have only met each other; undo the pairs of
+    # the group above and pair its players again together with the last
+    # group's, moving one group up at a time until the leftovers are paired
+    while len(floaters) > len(table) % 2 and len(group_players) > 1:
+        group_pairs.pop()
+        group_pairs.pop()
+        last = group_players.pop()
+        players = group_players.pop()
+        # the last group starts with the floaters of the one above
+        merged = set(players)
+        players = players + [player for player in last if player not in merged]
+
+        matched = _pairPlayers(table.ids, players, played_pairs)
+        group_pairs.append(matched)
+        group_players.append(players)
+        floaters = _unpaired(players, matched)
+
+    return [pair for matched in group_pairs for pair in matched]
+
+
+def _pairPlayers(ids, players, played_pairs):
+    """
+    Private method pairing `players` with _backtrackPairs(), or with
+    _blossomPairs() when the bounded search fails.
+
+    Returns: list of (idx1, idx2) index pairs.
+    """
+    matched = _backtrackPairs(ids, players, played_pairs, BACKTRACK_STEPS_PER_PLAYER * len(players) + 100)
+    if matched is None:
+        matched = _blossomPairs(ids, players, played_pairs)
+    return matched
+
+
+def _unpaired(players, pairs):
+    """Private method returning the players, in order, that are in none of the pairs."""
+    paired = set()
+    for first, second in pairs:
+        paired.add(first)
+        paired.add(second)
+    return [player for player in players if player not in paired]
+
+
+def _backtrackPairs(ids, players, played_pairs, max_steps):
+    """
+    Private method to pair `players` so that nobody meets an earlier opponent.
+    The first free player is paired with the nearest free player he or she
+    has not played; on a dead end the search backtracks.
+    At most len(players) % 2 players are left unpaired.
+    Args:
+        ids: player ids by index.
+        players: list of indices to pair, in order of preference.
+        played_pairs: set of pairKey() values of players who have already played.
+        max_steps: search budget.
+
+    Returns: list of (idx1, idx2) index pairs, or None when no pairing was
+     found within max_steps.
+    """
+    length = len(players)
+    player_ids = [ids[player] for player in players]
+    taken = [False] * length
+    # no. of players that may still be left unpaired
+    spare = [length % 2]
+
+    def advance(frame):
+        # move frame to the next possible partner of frame[0];
+        # frame[1] == length means the player floats down
+        position, partner = frame
+        player_id = player_ids[position]
+        for other in xrange(partner + 1, length):
+            if not taken[other] and pairKey(player_id, player_ids[other]) not in played_pairs:
+                taken[other] = True
+                frame[1] = other
+                return True
+        if partner < length and spare[0] > 0:
+            spare[0] -= 1
+            frame[1] = length
+            return True
+        return False
+
+    def undo(frame):
+        if frame[1] == length:
+            spare[0] += 1
+        else:
+            taken[frame[1]] = False
+
+    # one frame [position, partner] per decision taken
+    frames = []
+    start = 0
+    steps = 0
+
+    while True:
+        steps += 1
+        if steps > max_steps:
+            return None
+
+        # first player without a partner
+        while start < length and taken[start]:
+            start += 1
+        if start == length:
+            return [(players[position], players[partner])
+                    for position, partner in frames if partner < length]
+
+        frame = [start, start]
+        taken[start] = True
+        if advance(frame):
+            frames.append(frame)
+            start += 1
+            continue
+        taken[start] = False
+
+        # dead end, revisit earlier decisions
+        while frames:
+            steps += 1
+            frame = frames.pop()
+            undo(frame)
+            if advance(frame):
+                frames.append(frame)
+                start = frame[0] + 1
+                break
+            taken[frame[0]] = False
+        else:
+            return None
+
+
+def _blossomPairs(ids, players, played_pairs):
+    """
+    Private method to pair `players` with the blossom algorithm.
+    Used when _backtrackPairs() gives up on a group. Earlier players
+    (floaters) get heavier edges so they are preferred in the matching.
+    Args:
+        ids: player ids by index.
+        players: list of indices to pair, in order of preference.
+        played_pairs: set of pairKey() values of players who have already played.
+
+    Returns: list of (idx1, idx2) index pairs.
+    """
+    # create graph; nodes are positions in players
+    graph_ = nx.Graph()
+    graph_.add_nodes_from(xrange(len(players)))
+
+    length = len(players)
+    for first in xrange(length):
+        for second in xrange(first + 1, length):
+            # connect nodes (players) only when they have not played
+            # against each other
+            if pairKey(ids[players[first]], ids[players[second]]) not in played_pairs:
+                graph_.add_edge(first, second, weight=2 * length - first - second)
+
+    mate = nx.max_weight_matching(graph_, maxcardinality=True)
+
+    # networkx 1.x returns a dict holding both directions of every edge,
+    # 2.x a set with one tuple per edge
+    if isinstance(mate, dict):
+        mate = [(first, second) for first, second in mate.iteritems() if first < second]
+
+    return [(players[min(edge)], players[max(edge)]) for edge in mate]
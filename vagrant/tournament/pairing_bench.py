@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# pairing_bench.py -- time per round and peak memory of the Swiss pairing engine
+#
+# Runs the pairing step of swissPairings() (grouping + pairing) on synthetic
+# tournaments without touching the database. Every size runs in its own
+# process so that its peak memory is reported separately, e.g.
+#
+#   python pairing_bench.py
+#   python pairing_bench.py --sizes 64 512 --rounds 7
+#
+import argparse
+import multiprocessing
+import random
+import resource
+import time
+
+from pairing import pairKey
+from tournament import _groupPlayers, _makePairs
+
+DEFAULT_SIZES = [64, 512, 4096, 16384]
+
+
+def simulate(player_count, rounds):
+    """
+    Pair and play `rounds` rounds of a synthetic tournament; the winner of
+    each game is picked at random.
+    Args:
+        player_count: no. of players.
+        rounds: no. of rounds to play.
+
+    Returns: list of seconds spent pairing each round.
+    """
+    wins = dict((player_id, 0) for player_id in xrange(1, player_count + 1))
+    games = dict.fromkeys(wins, 0)
+    played_pairs = set()
+    timings = []
+
+    for _ in xrange(rounds):
+        standings = [(player_id, "Player %d" % player_id, wins[player_id], games[player_id])
+                     for player_id in wins]
+        standings.sort(key=lambda row: row[2], reverse=True)
+
+        start = time.time()
+        pairs = _makePairs(_groupPlayers(standings), played_pairs)
+        timings.append(time.time() - start)
+
+        for id1, _, id2, _ in pairs:
+            played_pairs.add(pairKey(id1, id2))
+            winner = random.choice((id1, id2))
+            wins[winner] += 1
+            games[id1] += 1
+            games[id2] += 1
+
+    return timings
+
+
+def _run(player_count, rounds, seed, queue):
+    # simulate in a child process and report timings and peak RSS in KB
+    random.seed(seed)
+    timings = simulate(player_count, rounds)
+    queue.put((timings, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Swiss pairing time per round.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="no. of players per tournament")
+    parser.add_argument('--rounds', type=int, default=5, help="no. of rounds to pair")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    print "%8s %8s %12s %12s %14s" % ("players", "rounds", "mean (ms)", "max (ms)", "peak RSS (MB)")
+    for size in args.sizes:
+        queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=_run, args=(size, args.rounds, args.seed, queue))
+        worker.start()
+        timings, max_rss = queue.get()
+        worker.join()
+        print "%8d %8d %12.2f %12.2f %14.1f" % (size, len(timings),
+                                               1000.0 * sum(timings) / len(timings),
+                                               1000.0 * max(timings),
+                                               max_rss / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#
+# sanitize.py -- memoized bleach.clean for tournament.py
+#
+import re
+import threading
+
+import bleach
+
+from cache import LRUCache
+
+# characters bleach.clean may change: markup and entities, and the control
+# characters it strips or normalizes ('\r', NUL, ...)
+_NEEDS_CLEANING = re.compile(u'[<>&\x00-\x08\x0b-\x1f\x7f-\x9f]')
+
+# input -> bleach.clean(input)
+_cache = LRUCache(maxsize=4096)
+
+_lock = threading.Lock()
+_bypassed = [0]
+
+
+def clean(text):
+    """
+    Escapes or strips markup and attributes, like bleach.clean(text).
+    Input bleach would return unchanged skips the HTML parser, and results
+    for repeated input (e.g. the tournament name of a bulk import) come from
+    a bounded LRU cache.
+    Args:
+        text: string to sanitize.
+
+    Returns: sanitized string.
+    """
+    if not _NEEDS_CLEANING.search(text):
+        with _lock:
+            _bypassed[0] += 1
+        return text
+
+    cleaned = _cache.get(text)
+    if cleaned is None:
+        cleaned = bleach.clean(text)
+        _cache.put(text, cleaned)
+    return cleaned
+
+
+def stats():
+    """
+    Returns: dict with the no. of inputs that bypassed the parser and the
+     hits, misses, hit_rate and size of the cache.
+    """
+    stats = _cache.stats()
+    with _lock:
+        stats['bypassed'] = _bypassed[0]
+    return stats
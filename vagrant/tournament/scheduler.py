@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# scheduler.py -- pairs the next round of many tournaments in parallel
+#
+# Swiss pairing is CPU-bound, so tournaments are paired on a pool of worker
+# processes, one tournament at a time per worker, e.g.
+#
+#   python scheduler.py "Chess Tournament" "Cricket Tournament" --processes 4
+#
+import argparse
+import multiprocessing
+import sys
+
+from tournament import createMatches, getStorage, swissPairings, transaction, _playerTournamentIds
+
+
+def pairTournaments(tournament_names, processes=None):
+    """
+    Pairs the next round of every tournament and creates its matches.
+    Every tournament is paired and its matches created in one transaction by
+    a worker process; each worker reads the standings and match history of
+    its tournament with one query each. With a storage engine that worker
+    processes can't share (see tournament.useStorage()), tournaments are
+    paired one after the other in this process instead.
+    Args:
+        tournament_names: names of the tournaments to pair.
+        processes: no. of worker processes, defaults to the no. of CPUs.
+
+    Returns: dict of tournament name -> list of pairings, see swissPairings().
+
+    Raises:
+        The first error raised pairing a tournament; the matches of the other
+        tournaments are created regardless.
+    """
+    # pairing a tournament twice would create two rounds
+    tournament_names = list(set(tournament_names))
+    if not tournament_names:
+        return {}
+
+    if not getStorage().multiprocess:
+        paired = {}
+        error = None
+        for tournament_name in tournament_names:
+            try:
+                paired.update([_pairTournament(tournament_name)])
+            except Exception:
+                error = error or sys.exc_info()
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return paired
+
+    pool = multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(tournament_names)))
+    try:
+        return dict(pool.map(_pairTournament, tournament_names, chunksize=1))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _pairTournament(tournament_name):
+    """
+    Private method run by the worker processes of pairTournaments() to pair
+    one tournament and create its matches in one transaction.
+    Args:
+        tournament_name: name of the tournament.
+
+    Returns: tuple of tournament name and its pairings.
+    """
+    with transaction():
+        pairings = swissPairings(tournament_name)
+
+        # look up the tournament of every paired player with one query,
+        # createMatches() then finds them cached
+        _playerTournamentIds([player_id for id1, _, id2, _ in pairings for player_id in (id1, id2)])
+
+        for id1, _, id2, _ in pairings:
+            createMatches(id1, id2)
+
+    return tournament_name, pairings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pair the next round of many tournaments in parallel.")
+    parser.add_argument('tournaments', nargs='+', help="names of the tournaments to pair")
+    parser.add_argument('--processes', type=int, default=None, help="no. of worker processes")
+    args = parser.parse_args()
+
+    for tournament_name, pairings in sorted(pairTournaments(args.tournaments, args.processes).items()):
+        print "%s: %d matches" % (tournament_name, len(pairings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+#
+# simulate.py -- Monte Carlo simulation of Swiss tournaments
+#
+# Registers players with random strength ratings, plays rounds of
+# swissPairings() and result reporting through tournament.py, and writes the
+# time spent in every phase, the no. of database round-trips and the peak
+# memory of every run as JSON, so runs can be compared across commits, e.g.
+#
+#   python simulate.py --players 64 1024 --runs 3 --output before.json
+#   python simulate.py --players 4096 --storage memory
+#   python simulate.py --players 256 --trace
+#
+# Every run is a child process, so that its peak memory is reported
+# separately. With --storage postgres the simulated tournaments are kept in
+# the tournamentproj database.
+#
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+import tournament
+import tracing
+from tournament import (createMatches, createTournament, playerStandings, registerPlayers,
+                        reportMatch, reportMatches, useStorage, _groupPlayers, _makePairs, _playedPairs)
+
+DEFAULT_SIZES = [64, 1024]
+
+# phases of a run, in order
+PHASES = ['register', 'playerStandings', '_groupPlayers', '_playedPairs', '_makePairs',
+          'createMatches', 'report']
+
+# no. of statements, COPYs, commits and rollbacks sent to the server by this process
+_round_trips = [0]
+
+
+class _CountingCursor(tracing.TracingCursor):
+    """Cursor counting the round-trips of its statements, and tracing them with --trace."""
+
+    def execute(self, *args, **kwargs):
+        _round_trips[0] += 1
+        return super(_CountingCursor, self).execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        _round_trips[0] += 1
+        return super(_CountingCursor, self).executemany(*args, **kwargs)
+
+    def copy_expert(self, *args, **kwargs):
+        _round_trips[0] += 1
+        return super(_CountingCursor, self).copy_expert(*args, **kwargs)
+
+
+class _CountingConnection(psycopg2.extensions.connection):
+    """Connection counting the round-trips of its cursors and transactions."""
+
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = _CountingCursor
+        return super(_CountingConnection, self).cursor(*args, **kwargs)
+
+    def commit(self):
+        _round_trips[0] += 1
+        return super(_CountingConnection, self).commit()
+
+    def rollback(self):
+        _round_trips[0] += 1
+        return super(_CountingConnection, self).rollback()
+
+
+def _countingConnect():
+    """Connect like tournament.connect(), counting round-trips."""
+    return psycopg2.connect("dbname=tournamentproj", connection_factory=_CountingConnection)
+
+
+def winProbability(rating, opponent_rating):
+    """
+    Returns: probability that a player beats an opponent, from the difference
+     of their ratings as in the Elo rating system.
+    """
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+def rankCorrelation(xs, ys):
+    """
+    Returns: Spearman's rank correlation of two lists of numbers, ties given
+     their average rank; 0.0 if either list is constant.
+    """
+    def ranks(values):
+        order = sorted(range(len(values)), key=values.__getitem__)
+        ranked = [0.0] * len(values)
+        i = 0
+        while i < len(order):
+            j = i
+            while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+                j += 1
+            for k in xrange(i, j + 1):
+                ranked[order[k]] = (i + j) / 2.0
+            i = j + 1
+        return ranked
+
+    rx, ry = ranks(xs), ranks(ys)
+    mx, my = sum(rx) / len(rx), sum(ry) / len(ry)
+    cov = sum((a - mx) * (b - my) for a, b in zip(rx, ry))
+    var = math.sqrt(sum((a - mx) ** 2 for a in rx) * sum((b - my) ** 2 for b in ry))
+    return cov / var if var else 0.0
+
+
+def simulate(player_count, rounds, rating_sd, batch):
+    """
+    Play a tournament of player_count players with ratings drawn from a normal
+    distribution (mean 1500); the winner of each match is drawn with
+    winProbability().
+    Args:
+        player_count: no. of players.
+        rounds: no. of rounds to play.
+        rating_sd: standard deviation of the ratings; 0 makes every match a coin toss.
+        batch: report a round with reportMatches() if True, reportMatch() per match otherwise.
+
+    Returns: dict of the seconds spent in every phase of every round, the
+     round-trips of every round and the outcome of the tournament.
+    """
+    timings = dict((phase, []) for phase in PHASES)
+    round_trips = []
+    unpaired = 0
+
+    tournament_name = "Simulation %d-%d-%d" % (time.time(), os.getpid(), player_count)
+    createTournament(tournament_name)
+
+    start_trips = _round_trips[0]
+    start = time.time()
+    registerPlayers(tournament_name, ("Player %d" % i for i in xrange(player_count)))
+    timings['register'].append(time.time() - start)
+    round_trips.append(_round_trips[0] - start_trips)
+
+    ratings = dict((row[0], random.gauss(1500, rating_sd)) for row in playerStandings(tournament_name))
+
+    for _ in xrange(rounds):
+        start_trips = _round_trips[0]
+
+        # the steps of swissPairings(), timed one by one
+        start = time.time()
+        standings = playerStandings(tournament_name)
+        timings['playerStandings'].append(time.time() - start)
+
+        start = time.time()
+        players_group = _groupPlayers(standings)
+        timings['_groupPlayers'].append(time.time() - start)
+
+        start = time.time()
+        played_pairs = _playedPairs(tournament_name)
+        timings['_playedPairs'].append(time.time() - start)
+
+        start = time.time()
+        pairs = _makePairs(players_group, played_pairs)
+        timings['_makePairs'].append(time.time() - start)
+        unpaired += player_count - 2 * len(pairs)
+
+        start = time.time()
+        for id1, _, id2, _ in pairs:
+            createMatches(id1, id2)
+        timings['createMatches'].append(time.time() - start)
+
+        results = []
+        for id1, _, id2, _ in pairs:
+            if random.random() < winProbability(ratings[id1], ratings[id2]):
+                results.append((id1, id2))
+            else:
+                results.append((id2, id1))
+
+        start = time.time()
+        if batch:
+            reportMatches(results)
+        else:
+            for winner_id, loser_id in results:
+                reportMatch(winner_id, loser_id)
+        timings['report'].append(time.time() - start)
+
+        round_trips.append(_round_trips[0] - start_trips)
+
+    standings = playerStandings(tournament_name)
+    return {'timings': timings,
+            'round_trips': round_trips,
+            'unpaired': unpaired,
+            # how well the final standings rank players by strength
+            'rank_correlation': rankCorrelation([ratings[row[0]] for row in standings],
+                                                [row[2] for row in standings])}
+
+
+def _run(player_count, args, seed, queue):
+    # simulate in a child process and report results and peak RSS in KB
+    try:
+        random.seed(seed)
+        useStorage(args.storage)
+        if args.storage == 'postgres':
+            # pool connections are created with tournament.connect
+            tournament.connect = _countingConnect
+        if args.trace:
+            tracing.enable()
+        rounds = args.rounds or int(math.ceil(math.log(max(player_count, 2), 2)))
+        result = simulate(player_count, rounds, args.rating_sd, args.report == 'batch')
+        if args.trace:
+            result['trace'] = tracing.report()
+        queue.put((result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, None))
+    except Exception as e:
+        queue.put((None, None, "%s: %s" % (type(e).__name__, e)))
+
+
+def _summary(seconds):
+    """Returns: dict of total, mean and max milliseconds of a list of seconds."""
+    return {'total_ms': 1000.0 * sum(seconds),
+            'mean_ms': 1000.0 * sum(seconds) / len(seconds) if seconds else 0.0,
+            'max_ms': 1000.0 * max(seconds) if seconds else 0.0}
+
+
+def _gitCommit():
+    """Returns: the commit checked out in this directory, or None."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=open(os.devnull, 'w'),
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Swiss tournaments and time every phase.")
+    parser.add_argument('--players', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="no. of players per tournament")
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="no. of rounds to play (default: log2 of the no. of players)")
+    parser.add_argument('--runs', type=int, default=1, help="no. of tournaments per size")
+    parser.add_argument('--rating-sd', type=float, default=200.0,
+                        help="standard deviation of the players' ratings")
+    parser.add_argument('--report', choices=('batch', 'single'), default='batch',
+                        help="report a round with reportMatches() or reportMatch() per match")
+    parser.add_argument('--storage', choices=('postgres', 'memory'),
+                        default=os.environ.get('TOURNAMENT_STORAGE', 'postgres'),
+                        help="storage engine, see tournament.useStorage()")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    parser.add_argument('--output', help="file to write the JSON results to (default: stdout)")
+    parser.add_argument('--trace', action='store_true',
+                        help="print the statements of every run by caller to stderr, see tracing.py")
+    args = parser.parse_args()
+
+    runs = []
+    for size in args.players:
+        for run in xrange(args.runs):
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=_run, args=(size, args, args.seed + run, queue))
+            worker.start()
+            result, max_rss, error = queue.get()
+            worker.join()
+            if error is not None:
+                sys.exit("Simulation of %d players failed: %s" % (size, error))
+
+            timings = result['timings']
+            runs.append({'players': size,
+                         'run': run,
+                         'rounds': len(timings['report']),
+                         'wall_ms': 1000.0 * sum(sum(seconds) for seconds in timings.values()),
+                         'phases': dict((phase, _summary(timings[phase])) for phase in PHASES),
+                         'round_trips': {'total': sum(result['round_trips']),
+                                         'register': result['round_trips'][0],
+                                         'per_round': result['round_trips'][1:]},
+                         'peak_rss_mb': max_rss / 1024.0,
+                         'unpaired': result['unpaired'],
+                         'rank_correlation': result['rank_correlation']})
+            print >> sys.stderr, "%6d players, run %d: %.1f ms, %d round-trips, %.1f MB" % (
+                size, run, runs[-1]['wall_ms'], runs[-1]['round_trips']['total'], runs[-1]['peak_rss_mb'])
+            if args.trace:
+                print >> sys.stderr, result['trace']
+
+    report = {'commit': _gitCommit(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'settings': {'storage': args.storage, 'report': args.report, 'rounds': args.rounds,
+                           'rating_sd': args.rating_sd, 'seed': args.seed},
+              'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# standing_bench.py -- result ingestion and standings reads with the row-level
+# standing triggers of tournament.sql and the statement-level ones of
+# standing_statement.sql
+#
+# Plays synthetic tournaments against the tournamentproj database, once per
+# set of triggers and way of reporting results (one INSERT per outcome like
+# reportMatch, or one multi-row INSERT per round). Everything runs in a
+# transaction that is rolled back, so the database is left as it was, e.g.
+#
+#   python standing_bench.py
+#   python standing_bench.py --sizes 256 1024 --rounds 3
+#
+import argparse
+import os
+import random
+import time
+
+from psycopg2.extras import execute_values
+
+from tournament import connect
+
+DEFAULT_SIZES = [256, 1024, 4096]
+
+STATEMENT_TRIGGERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standing_statement.sql')
+
+
+def simulate(cur, player_count, rounds, batch):
+    """
+    Register players, play `rounds` rounds and delete the matches of a
+    synthetic tournament; the winner of each game is picked at random.
+    Args:
+        cur: cursor in the transaction to run in.
+        player_count: no. of players.
+        rounds: no. of rounds to play.
+        batch: report the outcomes of a round with one statement if True,
+         one statement per outcome otherwise.
+
+    Returns: dict of seconds spent registering, reporting a round (mean),
+     reading standings (mean) and deleting matches.
+    """
+    timings = {}
+    cur.execute("INSERT INTO tournament(tournament_name) VALUES('standing bench') RETURNING tournament_id;")
+    [(tournament_id,)] = cur.fetchall()
+
+    # one statement per player, like registerPlayer()
+    start = time.time()
+    player_ids = []
+    for i in xrange(player_count):
+        cur.execute("INSERT INTO player(tournament_id, player_name) VALUES(%s, %s) RETURNING player_id;",
+                    (tournament_id, "Player %d" % i))
+        player_ids.append(cur.fetchone()[0])
+    timings['register'] = time.time() - start
+    # statistics of the new rows, as autovacuum would gather them
+    cur.execute("ANALYZE player; ANALYZE standing;")
+
+    report = standings = 0.0
+    half = player_count // 2
+    for round_ in xrange(rounds):
+        # round-robin (circle method) pairings, no two players meet twice
+        shift = round_ % (player_count - 1)
+        circle = player_ids[:1] + player_ids[1 + shift:] + player_ids[1:1 + shift]
+        pairs = zip(circle[:half], reversed(circle[half:]))
+        games = execute_values(cur, "INSERT INTO game(tournament_id, first_player_id, second_player_id) "
+                                    "VALUES %s RETURNING game_id, first_player_id, second_player_id;",
+                               [(tournament_id, id1, id2) for id1, id2 in pairs], fetch=True)
+        outcomes = [(game_id,) + random.choice(((id1, id2), (id2, id1)))
+                    for game_id, id1, id2 in games]
+
+        start = time.time()
+        if batch:
+            execute_values(cur, "INSERT INTO outcome(game_id, winner_player_id, loser_player_id) VALUES %s;",
+                           outcomes, page_size=len(outcomes))
+        else:
+            for outcome in outcomes:
+                cur.execute("INSERT INTO outcome(game_id, winner_player_id, loser_player_id) "
+                            "VALUES(%s, %s, %s);", outcome)
+        report += time.time() - start
+
+        # same query as playerStandings()
+        start = time.time()
+        cur.execute("SELECT p.player_id, p.player_name, s.player_win_count, s.player_game_count "
+                    "FROM player p "
+                    "JOIN standing s ON p.player_id = s.player_id "
+                    "WHERE p.tournament_id=%s "
+                    "ORDER BY s.player_win_count DESC;", (tournament_id,))
+        cur.fetchall()
+        standings += time.time() - start
+
+    timings['report'] = report / rounds
+    timings['standings'] = standings / rounds
+
+    # like deleteOutcome() + deleteMatches(), for this tournament only
+    start = time.time()
+    cur.execute("DELETE FROM outcome WHERE game_id IN (SELECT game_id FROM game WHERE tournament_id=%s);",
+                (tournament_id,))
+    cur.execute("DELETE FROM game WHERE tournament_id=%s;", (tournament_id,))
+    timings['delete'] = time.time() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-level against statement-level standing triggers.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="no. of players per tournament")
+    parser.add_argument('--rounds', type=int, default=5, help="no. of rounds to play")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    with open(STATEMENT_TRIGGERS) as f:
+        statement_triggers = f.read()
+
+    print "%8s %10s %8s %14s %14s %14s %12s" % ("players", "triggers", "report", "register (ms)",
+                                               "round (ms)", "standings (ms)", "delete (ms)")
+    conn = connect()
+    try:
+        for size in args.sizes:
+            for triggers in ('row', 'statement'):
+                for batch in (False, True):
+                    random.seed(args.seed)
+                    cur = conn.cursor()
+                    try:
+                        if triggers == 'statement':
+                            cur.execute(statement_triggers)
+                        timings = simulate(cur, size, args.rounds, batch)
+                    finally:
+                        cur.close()
+                        conn.rollback()
+                    print "%8d %10s %8s %14.1f %14.1f %14.2f %12.1f" % (
+                        size, triggers, 'batch' if batch else 'single',
+                        1000 * timings['register'], 1000 * timings['report'],
+                        1000 * timings['standings'], 1000 * timings['delete'])
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+-- Statement-level standing triggers for the tournament project.
+--
+-- Optional; install after tournament.sql to replace its row-level standing
+-- triggers with statement-level ones (PostgreSQL 10+):
+--
+--   psql tournamentproj -f tournament.sql -f standing_statement.sql
+--
+-- Each trigger sees all the rows of its statement at once through a transition
+-- table and updates standing with one set-based statement, instead of one or
+-- two single-row UPDATEs per player, outcome or game. tournament.py works the
+-- same with either set of triggers; bulk loaders still turn them off with
+-- SET LOCAL tournament.bulk_standing = 'on'.
+--
+-- To go back to the row-level triggers, recreate the database from tournament.sql
+-- alone.
+
+
+-- DROP ROW-LEVEL TRIGGERS
+DROP TRIGGER IF EXISTS trig_insert_standing ON player;
+DROP TRIGGER IF EXISTS trig_update_standing ON outcome;
+DROP TRIGGER IF EXISTS trig_reset_standing ON game;
+
+
+-- CREATE FUNCTIONS
+-- func_insert_standing_stmt
+-- one standing row per new player
+CREATE OR REPLACE FUNCTION func_insert_standing_stmt() RETURNS TRIGGER AS $trig_insert_standing$
+BEGIN
+    IF (current_setting('tournament.bulk_standing', TRUE) = 'on') THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO standing(player_id)
+    SELECT player_id FROM new_player;
+    RETURN NULL;
+END;
+$trig_insert_standing$ LANGUAGE plpgsql;
+
+-- func_update_standing_stmt
+-- adds the wins and games of all new outcomes, one UPDATE per statement
+CREATE OR REPLACE FUNCTION func_update_standing_stmt() RETURNS TRIGGER AS $trig_update_standing$
+BEGIN
+    IF (current_setting('tournament.bulk_standing', TRUE) = 'on') THEN
+        RETURN NULL;
+    END IF;
+    UPDATE standing s
+        SET player_win_count = s.player_win_count + d.wins,
+            player_game_count = s.player_game_count + d.games
+    FROM (
+        SELECT player_id, SUM(win) AS wins, COUNT(*) AS games
+        FROM (
+            SELECT winner_player_id AS player_id, 1 AS win FROM new_outcome
+            UNION ALL
+            SELECT loser_player_id, 0 FROM new_outcome
+        ) r
+        GROUP BY player_id
+    ) d
+    WHERE s.player_id = d.player_id;
+    RETURN NULL;
+END;
+$trig_update_standing$ LANGUAGE plpgsql;
+
+-- func_reset_standing_stmt
+-- resets every player of the deleted games, one UPDATE per statement
+CREATE OR REPLACE FUNCTION func_reset_standing_stmt() RETURNS TRIGGER AS $trig_reset_standing$
+BEGIN
+    UPDATE standing
+        SET player_win_count = 0, player_game_count = 0
+    WHERE player_id IN (
+        SELECT first_player_id FROM old_game
+        UNION
+        SELECT second_player_id FROM old_game
+    );
+    RETURN NULL;
+END;
+$trig_reset_standing$ LANGUAGE plpgsql;
+
+
+-- CREATE TRIGGERS
+-- trig_insert_standing_stmt
+DROP TRIGGER IF EXISTS trig_insert_standing_stmt ON player;
+CREATE TRIGGER trig_insert_standing_stmt
+AFTER INSERT ON player
+REFERENCING NEW TABLE AS new_player
+FOR EACH STATEMENT EXECUTE PROCEDURE func_insert_standing_stmt();
+
+-- trig_update_standing_stmt
+DROP TRIGGER IF EXISTS trig_update_standing_stmt ON outcome;
+CREATE TRIGGER trig_update_standing_stmt
+AFTER INSERT ON outcome
+REFERENCING NEW TABLE AS new_outcome
+FOR EACH STATEMENT EXECUTE PROCEDURE func_update_standing_stmt();
+
+-- trig_reset_standing_stmt
+DROP TRIGGER IF EXISTS trig_reset_standing_stmt ON game;
+CREATE TRIGGER trig_reset_standing_stmt
+AFTER DELETE ON game
+REFERENCING OLD TABLE AS old_game
+FOR EACH STATEMENT EXECUTE PROCEDURE func_reset_standing_stmt();
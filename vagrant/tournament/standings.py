@@ -0,0 +1,89 @@
+#
+# standings.py -- in-memory standings of a tournament, kept in sync by tournament.py
+#
+import threading
+
+
+class Standings(object):
+    """
+    Standings of one tournament, bucketed by win count.
+
+    Players are kept in one bucket per score so that the standings (and the
+    score groups used for pairing) are read without a query or a full sort,
+    and a reported match only moves its two players between buckets.
+    Updates mirror the triggers of the `standing` table.
+    """
+
+    def __init__(self, rows=()):
+        """
+        Args:
+            rows: iterable of (id, name, wins, matches) tuples to start from.
+        """
+        self._lock = threading.Lock()
+        # player_id -> [name, wins, matches]
+        self._players = {}
+        # wins -> {player_id: None}; dicts keep membership tests O(1)
+        self._buckets = {}
+
+        for player_id, player_name, wins, matches in rows:
+            self._add(player_id, player_name, wins, matches)
+
+    def addPlayer(self, player_id, player_name):
+        """Add a newly registered player with no matches."""
+        with self._lock:
+            self._add(player_id, player_name, 0, 0)
+
+    def recordResult(self, winner_id, loser_id):
+        """Apply the outcome of a match, like trig_update_standing."""
+        with self._lock:
+            self._move(winner_id, 1, 1)
+            self._move(loser_id, 0, 1)
+
+    def reset(self):
+        """Set every player back to no wins and no matches, like trig_reset_standing."""
+        with self._lock:
+            for player in self._players.itervalues():
+                player[1] = 0
+                player[2] = 0
+            self._buckets = {0: dict.fromkeys(self._players)} if self._players else {}
+
+    def __contains__(self, player_id):
+        return player_id in self._players
+
+    def __len__(self):
+        return len(self._players)
+
+    def rows(self):
+        """
+        Returns: list of (id, name, wins, matches) tuples sorted by wins,
+         most wins first; the same rows tournament.playerStandings() returns.
+        """
+        rows = []
+        for group in self.groups():
+            rows.extend(group)
+        return rows
+
+    def groups(self):
+        """
+        Returns: list of players grouped according to their standings, highest
+         win count first; the same groups tournament._groupPlayers() builds.
+        """
+        with self._lock:
+            players = self._players
+            return [[(player_id,) + tuple(players[player_id]) for player_id in self._buckets[wins]]
+                    for wins in sorted(self._buckets, reverse=True)]
+
+    def _add(self, player_id, player_name, wins, matches):
+        self._players[player_id] = [player_name, wins, matches]
+        self._buckets.setdefault(wins, {})[player_id] = None
+
+    def _move(self, player_id, wins, matches):
+        player = self._players[player_id]
+        bucket = self._buckets[player[1]]
+        if wins:
+            del bucket[player_id]
+            if not bucket:
+                del self._buckets[player[1]]
+            self._buckets.setdefault(player[1] + wins, {})[player_id] = None
+        player[1] += wins
+        player[2] += matches
@@ -0,0 +1,913 @@
+#
+# storage.py -- storage engines of tournament.py
+#
+# PostgresStorage keeps tournaments in the database of tournament.sql;
+# MemoryStorage keeps them in dicts of the current process, for simulations,
+# what-if pairings and tests that don't need them to persist. tournament.py
+# validates, sanitizes and caches, then calls one engine; see
+# tournament.useStorage().
+#
+import abc
+import itertools
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+import pairing
+import tracing
+
+# name -> (sql, PREPARE statement, EXECUTE statement) of the statements
+# PostgresStorage runs as server-side prepared statements, see _statement()
+_statements = {}
+_statements_lock = threading.Lock()
+
+# connection -> names of the statements prepared on it, whichever
+# PostgresStorage prepared them; a connection opened to replace a lost one
+# starts with none
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+# named parameter of a statement, e.g. %(tournament_id)s
+_PARAM = re.compile(r"%\((\w+)\)s")
+
+# default no. of rows fetched per round-trip by streamed queries, see
+# PostgresStorage._iterSql()
+STREAM_ITERSIZE = 2000
+
+# numbers the server-side cursors of streamed queries
+_stream_ids = itertools.count(1)
+
+
+class Storage(object):
+    """
+    Interface of the storage engines. Every method runs in a transaction of its
+    own unless called inside a transaction() block of the same thread.
+
+    Engines raise ValueError when a change would break a constraint of
+    tournament.sql they enforce: unique tournament names, one match per pair
+    of players, and no deletion of rows other rows still refer to (e.g.
+    deletePlayers() while matches are left), rather than the error of their
+    backend such as psycopg2.IntegrityError.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # name of the engine, see tournament.useStorage()
+    name = None
+
+    # whether worker processes see the same data, see scheduler.py
+    multiprocess = False
+
+    @abc.abstractmethod
+    def transaction(self):
+        """
+        Context manager running the calls made in its block, by the same thread,
+        in one transaction; committed when the block succeeds, rolled back when
+        it raises.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deleteTournaments(self):
+        """Remove all tournaments."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deleteMatches(self):
+        """Remove all matches; players of the removed matches are reset to no wins and no matches."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deletePlayers(self):
+        """Remove all players and their standing."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deleteOutcome(self):
+        """Remove the outcomes of all matches; standings are left as they are."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def deleteStanding(self):
+        """Remove the standing of all players."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def countPlayers(self):
+        """Returns: no. of players of all tournaments."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def createTournament(self, tournament_name):
+        """Add a tournament named tournament_name."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def tournamentId(self, tournament_name):
+        """Returns: id of the tournament named tournament_name, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def playerTournamentIds(self, player_ids):
+        """Returns: dict of player_id -> tournament_id of the players that exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def registerPlayer(self, tournament_id, player_name):
+        """Add a player with no wins and no matches. Returns: the new player_id."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def registerPlayers(self, tournament_id, player_names):
+        """Add many players. Returns: list of (player_id, player_name) tuples of the new players."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def standings(self, tournament_id):
+        """Returns: list of (id, name, wins, matches) tuples of a tournament, sorted by wins."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iterStandings(self, tournament_id, itersize=None):
+        """
+        Returns: iterator over the rows of standings(), read itersize rows at a
+         time instead of all at once.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iterMatchHistory(self, tournament_id, itersize=None):
+        """
+        Returns: iterator of (game_id, first_player_id, first_player_name,
+         second_player_id, second_player_name, winner_id) tuples of the matches
+         of a tournament in the order they were created, read itersize rows at
+         a time; one per outcome of a match, with winner_id None for a match
+         without outcome.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def playedPairs(self, tournament_id):
+        """Returns: iterable of (first_player_id, second_player_id) of the matches of a tournament."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def hasPlayedEarlier(self, first_player_id, second_player_id):
+        """Returns: whether the two players have a match, whichever of them is first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def createMatch(self, tournament_id, first_player_id, second_player_id):
+        """Add a match between two players of a tournament."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reportMatch(self, winner_id, loser_id):
+        """Record the outcome of the match between two players and update their standing."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reportMatches(self, results):
+        """
+        Record the outcomes of many matches and update the standing of their players.
+        Args:
+            results: list of (winner_id, loser_id) tuples.
+
+        Raises:
+            ValueError: if there isn't exactly one match between the players of a result.
+        """
+        raise NotImplementedError
+
+
+class PostgresStorage(Storage):
+    """
+    Storage in the PostgreSQL database of tournament.sql, through a connection
+    pool; the standing table is kept up to date by its triggers.
+    """
+
+    name = 'postgres'
+    multiprocess = True
+
+    # queries of the hot lookups; tournament_test.testIndexScans() checks
+    # that each is served by the index of tournament.sql it is meant to use
+
+    # tournamentId() (idx_tournament_name)
+    _TOURNAMENT_ID_SQL = "SELECT tournament_id FROM tournament WHERE tournament_name=%(tournament_name)s;"
+
+    # playerTournamentIds() (player_pkey)
+    _PLAYER_TOURNAMENT_IDS_SQL = "SELECT player_id, tournament_id FROM player WHERE player_id = ANY(%(player_ids)s);"
+
+    # standings() and iterStandings() (idx_player_tournament)
+    _STANDINGS_SQL = "SELECT p.player_id, p.player_name, s.player_win_count, s.player_game_count " \
+                     "FROM player p " \
+                     "JOIN standing s ON p.player_id = s.player_id " \
+                     "WHERE p.tournament_id=%(tournament_id)s " \
+                     "ORDER BY s.player_win_count DESC;"
+
+    # playedPairs() (idx_game_tournament)
+    _PLAYED_PAIRS_SQL = "SELECT first_player_id, second_player_id " \
+                        "FROM game " \
+                        "WHERE tournament_id=%(tournament_id)s;"
+
+    # hasPlayedEarlier(); looks up the game by its unordered pair key (idx_game_pair)
+    _HAS_PLAYED_EARLIER_SQL = "SELECT COUNT(*) " \
+                              "FROM game " \
+                              "WHERE LEAST(first_player_id, second_player_id)=" \
+                              "LEAST(%(first_player_id)s::int, %(second_player_id)s::int) " \
+                              "AND GREATEST(first_player_id, second_player_id)=" \
+                              "GREATEST(%(first_player_id)s::int, %(second_player_id)s::int);"
+
+    # reportMatch(); looks up the game by its unordered pair key (idx_game_pair)
+    _GAME_ID_SQL = "SELECT game_id " \
+                   "FROM game " \
+                   "WHERE LEAST(first_player_id, second_player_id)=LEAST(%(winner_id)s::int, %(loser_id)s::int) " \
+                   "AND GREATEST(first_player_id, second_player_id)=GREATEST(%(winner_id)s::int, %(loser_id)s::int);"
+
+    # reportMatches(); game between the players of every result (idx_game_pair)
+    _RESULT_GAMES_SQL = "SELECT r.winner_id, r.loser_id, g.game_id " \
+                        "FROM unnest(%(winner_ids)s::int[], %(loser_ids)s::int[]) AS r(winner_id, loser_id) " \
+                        "JOIN game g ON " \
+                        "LEAST(g.first_player_id, g.second_player_id) = LEAST(r.winner_id, r.loser_id) " \
+                        "AND GREATEST(g.first_player_id, g.second_player_id) = GREATEST(r.winner_id, r.loser_id);"
+
+    # reportMatches(); adds wins and games per player (idx_standing_player)
+    _UPDATE_STANDINGS_SQL = "UPDATE standing s " \
+                            "SET player_win_count = s.player_win_count + d.wins, " \
+                            "player_game_count = s.player_game_count + d.games " \
+                            "FROM unnest(%(player_ids)s::int[], %(wins)s::int[], %(games)s::int[]) " \
+                            "AS d(player_id, wins, games) " \
+                            "WHERE s.player_id = d.player_id;"
+
+    # iterMatchHistory() (idx_game_tournament, idx_outcome_game)
+    _MATCH_HISTORY_SQL = "SELECT g.game_id, g.first_player_id, p1.player_name, g.second_player_id, p2.player_name, " \
+                         "o.winner_player_id " \
+                         "FROM game g " \
+                         "JOIN player p1 ON p1.player_id = g.first_player_id " \
+                         "JOIN player p2 ON p2.player_id = g.second_player_id " \
+                         "LEFT JOIN outcome o ON o.game_id = g.game_id " \
+                         "WHERE g.tournament_id=%(tournament_id)s " \
+                         "ORDER BY g.game_id;"
+
+    def __init__(self, getpool, prepare=True):
+        """
+        Args:
+            getpool: callable returning the dbpool.ConnectionPool to use.
+            prepare: run the statements of the hottest calls as server-side
+             prepared statements, see _execute().
+        """
+        self._getpool = getpool
+        self._prepare = prepare
+        # cursor of the thread's transaction() block, if any
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, 'cursor', None) is not None:
+            yield
+            return
+
+        with self._transaction() as cur:
+            self._local.cursor = cur
+            try:
+                yield
+            finally:
+                self._local.cursor = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Private context manager yielding a cursor on a pooled connection.
+        Commits when the block succeeds, rolls back when it raises; the connection
+        is returned to the pool either way.
+        Inside a transaction() block it yields the cursor of that block instead,
+        which is committed or rolled back with the block.
+        """
+        cur = getattr(self._local, 'cursor', None)
+        if cur is not None:
+            yield cur
+            return
+
+        pool = self._getpool()
+        conn = pool.getconn()
+        try:
+            if tracing.isEnabled():
+                cur = conn.cursor(cursor_factory=tracing.TracingCursor)
+            else:
+                cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+            conn.commit()
+        except:
+            # don't hand out a connection that was lost mid-transaction
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except psycopg2.Error:
+                pass
+            pool.putconn(conn, close=bool(conn.closed))
+            raise
+        pool.putconn(conn)
+
+    def _exeSql(self, sql, dict_, name=None):
+        """
+        Private method to be used by methods of this class to exe sql query.
+        Args:
+            sql: sql query
+            dict_: dictionary of params that need to be replaced in sql query.
+            name: name to run the query as a prepared statement, see _execute().
+
+        Returns: resultSet returned by SELECT statements.
+        """
+        with self._transaction() as cur:
+            # execute sql query
+            self._execute(cur, sql, dict_, name)
+
+            # declare resultSet
+            resultSet = ()
+
+            # fetch results only for stmns. returning rows
+            if cur.description is not None:
+                resultSet = cur.fetchall()
+
+        return resultSet
+
+    def _iterSql(self, sql, dict_, itersize=None):
+        """
+        Private generator to be used by methods of this class to stream the rows
+        of a sql query from a named server-side cursor, itersize rows per
+        round-trip, instead of loading them all at once like _exeSql().
+        The pooled connection is held until the rows are exhausted or the
+        generator is closed; inside a transaction() block the rows must be read
+        before the block ends.
+        Args:
+            sql: sql query
+            dict_: dictionary of params that need to be replaced in sql query.
+            itersize: no. of rows per round-trip, default STREAM_ITERSIZE.
+
+        Yields: rows of the query.
+        """
+        with self._transaction() as cur:
+            # same cursor class, e.g. tracing.TracingCursor
+            stream = cur.connection.cursor("tournament_stream_%d" % next(_stream_ids),
+                                           cursor_factory=type(cur))
+            stream.itersize = itersize or STREAM_ITERSIZE
+            try:
+                stream.execute(sql, dict_)
+                for row in stream:
+                    yield row
+            finally:
+                stream.close()
+
+    def _execute(self, cur, sql, dict_, name=None):
+        """
+        Private method executing sql on cur. With a name (and prepare set), sql
+        runs as the server-side prepared statement of that name, so the server
+        parses and plans it once per connection instead of on every call; it is
+        prepared on the first use on each connection, including connections
+        opened to replace lost ones. When the server lost it (or still has one
+        the registry forgot) and nothing ran before in the transaction, it is
+        prepared again (or taken as prepared) and the call goes on.
+        Args:
+            cur: cursor to execute on.
+            sql: sql query with %(name)s params.
+            dict_: dictionary of params that need to be replaced in sql query.
+            name: name of the prepared statement, None to send sql as it is.
+        """
+        if name is None or not self._prepare:
+            cur.execute(sql, dict_)
+            return
+
+        prepare, execute = _statement(name, sql)
+        with _prepared_lock:
+            prepared = _prepared.setdefault(cur.connection, set())
+        # whether nothing ran yet in the transaction, so a rollback loses nothing
+        first = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        if name not in prepared:
+            try:
+                # prepared statements outlive the transaction, even rolled back
+                cur.execute(prepare)
+            except psycopg2.errors.DuplicatePreparedStatement:
+                # the server has it already, the registry lost track of it
+                prepared.add(name)
+                if not first:
+                    raise
+                cur.connection.rollback()
+            prepared.add(name)
+
+        try:
+            cur.execute(execute, dict_)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # the server lost the statement, e.g. on DISCARD ALL or DEALLOCATE;
+            # other names are dropped from the registry when they fail in turn
+            prepared.discard(name)
+            if not first:
+                # retrying would need the earlier statements of the transaction
+                # rolled back too; fail it, prepare again on the next use
+                raise
+            cur.connection.rollback()
+            cur.execute(prepare)
+            prepared.add(name)
+            cur.execute(execute, dict_)
+
+    def _delete(self, sql, message):
+        """
+        Private method running a DELETE, raising ValueError(message) instead
+        of the driver's error when rows of other tables still refer to the
+        deleted rows.
+        """
+        try:
+            self._exeSql(sql, None)
+        except psycopg2.errors.ForeignKeyViolation:
+            raise ValueError(message)
+
+    def deleteTournaments(self):
+        # sql statement
+        sql = "DELETE FROM tournament;"
+
+        # execute sql
+        self._delete(sql, "Tournaments still have players or matches.")
+
+    def deleteMatches(self):
+        # sql statement; trig_reset_standing resets the players
+        sql = "DELETE FROM game;"
+
+        # execute sql
+        self._delete(sql, "Matches still have outcomes.")
+
+    def deletePlayers(self):
+        # sql statement; standing rows are deleted on cascade
+        sql = "DELETE FROM player;"
+
+        # execute sql
+        self._delete(sql, "Players still have matches.")
+
+    def deleteOutcome(self):
+        sql = "DELETE FROM outcome;"
+
+        # execute sql
+        self._exeSql(sql, None)
+
+    def deleteStanding(self):
+        sql = "DELETE FROM standing;"
+
+        # execute sql
+        self._exeSql(sql, None)
+
+    def countPlayers(self):
+        # sql statement
+        sql = "SELECT COUNT(*) FROM player;"
+
+        return int(self._exeSql(sql, None)[0][0])
+
+    def createTournament(self, tournament_name):
+        # sql statement
+        sql = "INSERT INTO tournament(tournament_name) VALUES(%(tournament_name)s);"
+
+        # execute sql
+        try:
+            self._exeSql(sql, {'tournament_name': tournament_name})
+        except psycopg2.IntegrityError as e:
+            if e.diag.constraint_name != 'idx_tournament_name':
+                raise
+            raise ValueError("Tournament %s already exists." % tournament_name)
+
+    def tournamentId(self, tournament_name):
+        resultSet = self._exeSql(self._TOURNAMENT_ID_SQL, {'tournament_name': tournament_name}, 'stmt_tournament_id')
+        if not resultSet:
+            return None
+        return resultSet[0][0]
+
+    def playerTournamentIds(self, player_ids):
+        return dict(self._exeSql(self._PLAYER_TOURNAMENT_IDS_SQL, {'player_ids': list(player_ids)},
+                                 'stmt_player_tournament_ids'))
+
+    def registerPlayer(self, tournament_id, player_name):
+        # sql statement
+        sql = "INSERT INTO player(tournament_id, player_name) VALUES(%(tournament_id)s, %(player_name)s) " \
+              "RETURNING player_id;"
+
+        # execute sql
+        with self._transaction() as cur:
+            self._execute(cur, sql, {'tournament_id': tournament_id, 'player_name': player_name},
+                          'stmt_register_player')
+            [(player_id,)] = cur.fetchall()
+        return player_id
+
+    def registerPlayers(self, tournament_id, player_names):
+        """
+        Names are streamed to the server with COPY and the players' standing
+        rows are created with one set-based insert.
+        """
+        with self._transaction() as cur:
+            # stage names in a temp table
+            cur.execute("CREATE TEMP TABLE tmp_player_name(player_name TEXT) ON COMMIT DROP;")
+            cur.copy_expert("COPY tmp_player_name(player_name) FROM STDIN;", _CopyReader(player_names))
+
+            # standing rows are inserted below,
+            # skip the per-row trigger for this transaction
+            cur.execute("SET LOCAL tournament.bulk_standing = 'on';")
+
+            cur.execute("WITH new_player AS ("
+                        "INSERT INTO player(tournament_id, player_name) "
+                        "SELECT %(tournament_id)s, player_name FROM tmp_player_name "
+                        "RETURNING player_id, player_name), "
+                        "new_standing AS ("
+                        "INSERT INTO standing(player_id) SELECT player_id FROM new_player) "
+                        "SELECT player_id, player_name FROM new_player;",
+                        {'tournament_id': tournament_id})
+            new_players = cur.fetchall()
+
+            # the transaction may go on, see transaction()
+            cur.execute("SET LOCAL tournament.bulk_standing = 'off';")
+            cur.execute("DROP TABLE tmp_player_name;")
+
+        return new_players
+
+    def standings(self, tournament_id):
+        return self._exeSql(self._STANDINGS_SQL, {'tournament_id': tournament_id}, 'stmt_standings')
+
+    def iterStandings(self, tournament_id, itersize=None):
+        # named cursors can't run prepared statements
+        return self._iterSql(self._STANDINGS_SQL, {'tournament_id': tournament_id}, itersize)
+
+    def iterMatchHistory(self, tournament_id, itersize=None):
+        return self._iterSql(self._MATCH_HISTORY_SQL, {'tournament_id': tournament_id}, itersize)
+
+    def playedPairs(self, tournament_id):
+        return self._exeSql(self._PLAYED_PAIRS_SQL, {'tournament_id': tournament_id}, 'stmt_played_pairs')
+
+    def hasPlayedEarlier(self, first_player_id, second_player_id):
+        # exe query
+        matchCount = self._exeSql(self._HAS_PLAYED_EARLIER_SQL,
+                                  {'first_player_id': first_player_id, 'second_player_id': second_player_id},
+                                  'stmt_has_played_earlier')
+
+        return int(matchCount[0][0]) != 0
+
+    def createMatch(self, tournament_id, first_player_id, second_player_id):
+        # create query
+        sql = "INSERT INTO game(tournament_id, first_player_id, second_player_id) " \
+              "VALUES(%(tournament_id)s, %(first_player_id)s, %(second_player_id)s);"
+
+        # exe query
+        try:
+            self._exeSql(sql, {'tournament_id': tournament_id, 'first_player_id': first_player_id,
+                               'second_player_id': second_player_id}, 'stmt_create_match')
+        except psycopg2.IntegrityError as e:
+            if e.diag.constraint_name != 'idx_game_pair':
+                raise
+            raise ValueError("Players %s and %s already have a match." % (first_player_id, second_player_id))
+
+    def reportMatch(self, winner_id, loser_id):
+        with self.transaction():
+            # exe for game_id
+            [(game_id,)] = self._exeSql(self._GAME_ID_SQL, {'winner_id': winner_id, 'loser_id': loser_id},
+                                        'stmt_game_id')
+
+            # create query; trig_update_standing updates the standing of both players
+            sql = "INSERT INTO outcome(game_id, winner_player_id, loser_player_id) " \
+                  "VALUES(%(game_id)s, %(winner_player_id)s, %(loser_player_id)s);"
+
+            # exe query
+            self._exeSql(sql, {'game_id': game_id, 'winner_player_id': winner_id, 'loser_player_id': loser_id},
+                         'stmt_report_match')
+
+    def reportMatches(self, results):
+        """
+        All games are looked up with one query, the outcomes are inserted with
+        one multi-row insert and the standings of every player involved are
+        updated with one set-based statement.
+        """
+        winner_ids = [winner_id for winner_id, _ in results]
+        loser_ids = [loser_id for _, loser_id in results]
+
+        with self._transaction() as cur:
+            # game between the players of every result
+            cur.execute(self._RESULT_GAMES_SQL, {'winner_ids': winner_ids, 'loser_ids': loser_ids})
+            game_ids = {}
+            for winner_id, loser_id, game_id in cur.fetchall():
+                game_ids.setdefault((winner_id, loser_id), []).append(game_id)
+
+            outcomes = []
+            for winner_id, loser_id in results:
+                games = game_ids.get((winner_id, loser_id), [])
+                if len(games) != 1:
+                    raise ValueError("Expected one game between players %s and %s, found %d."
+                                     % (winner_id, loser_id, len(games)))
+                outcomes.append((games[0], winner_id, loser_id))
+
+            # standing is updated below in one statement,
+            # skip the per-row trigger for this transaction
+            cur.execute("SET LOCAL tournament.bulk_standing = 'on';")
+
+            # one multi-row insert for the whole batch
+            execute_values(cur, "INSERT INTO outcome(game_id, winner_player_id, loser_player_id) VALUES %s;",
+                           outcomes, page_size=len(outcomes))
+
+            # wins and games to add per player
+            deltas = {}
+            for winner_id, loser_id in results:
+                wins, games = deltas.get(winner_id, (0, 0))
+                deltas[winner_id] = (wins + 1, games + 1)
+                wins, games = deltas.get(loser_id, (0, 0))
+                deltas[loser_id] = (wins, games + 1)
+
+            cur.execute(self._UPDATE_STANDINGS_SQL,
+                        {'player_ids': deltas.keys(),
+                         'wins': [wins for wins, _ in deltas.values()],
+                         'games': [games for _, games in deltas.values()]})
+
+            # the transaction may go on, see transaction()
+            cur.execute("SET LOCAL tournament.bulk_standing = 'off';")
+
+
+def _statement(name, sql):
+    """
+    Private function registering sql as the prepared statement name.
+    Args:
+        name: name of the prepared statement.
+        sql: sql query with %(name)s params.
+
+    Returns: tuple of the PREPARE statement and the EXECUTE statement with
+     %(name)s params.
+
+    Raises:
+        ValueError: if name is already registered with another query.
+    """
+    statement = _statements.get(name)
+    if statement is None:
+        params = []
+
+        def placeholder(match):
+            # PREPARE numbers params by first appearance
+            if match.group(1) not in params:
+                params.append(match.group(1))
+            return "$%d" % (params.index(match.group(1)) + 1)
+
+        body = _PARAM.sub(placeholder, sql).rstrip().rstrip(';')
+        statement = (sql,
+                     "PREPARE %s AS %s;" % (name, body),
+                     "EXECUTE %s(%s);" % (name, ", ".join("%%(%s)s" % param for param in params)))
+        with _statements_lock:
+            statement = _statements.setdefault(name, statement)
+
+    if statement[0] != sql:
+        raise ValueError("Prepared statement %s is registered with another query." % name)
+    return statement[1:]
+
+
+class _CopyReader(object):
+    """
+    Private file-like object feeding an iterable of strings to COPY ... FROM STDIN
+    in text format, one value per line, without building the whole input in memory.
+    """
+
+    def __init__(self, values):
+        self._lines = (_copyEscape(value) + '\n' for value in values)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copyEscape(value):
+    """Private method to escape a value for COPY text format."""
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+
+
+class MemoryStorage(Storage):
+    """
+    Storage in dicts of the current process, with the same tables, constraints
+    and standing updates as tournament.sql and an index for every lookup.
+    Data is lost when the process exits and is not seen by other processes.
+
+    Calls are serialized with a lock, held by a transaction() block until it
+    ends. Changes made in a transaction are recorded in an undo log and
+    reverted if it is rolled back; ids, like sequences, are not reused.
+    """
+
+    name = 'memory'
+    multiprocess = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # undo actions of the transaction in progress, None outside transactions
+        self._undo = None
+
+        self._tournament_seq = itertools.count(1)
+        self._player_seq = itertools.count(1)
+        self._game_seq = itertools.count(1)
+
+        # tournament_id -> tournament_name
+        self._tournaments = {}
+        # tournament_name -> tournament_id (idx_tournament_name)
+        self._tournament_names = {}
+        # player_id -> (tournament_id, player_name)
+        self._players = {}
+        # tournament_id -> {player_id: None} (idx_player_tournament)
+        self._tournament_players = {}
+        # player_id -> (wins, matches)
+        self._standing = {}
+        # game_id -> (tournament_id, first_player_id, second_player_id)
+        self._games = {}
+        # pairing.pairKey() of the players -> game_id (idx_game_pair)
+        self._game_pairs = {}
+        # tournament_id -> {game_id: None} (idx_game_tournament)
+        self._tournament_games = {}
+        # game_id -> tuple of (winner_id, loser_id) outcomes (idx_outcome_game)
+        self._outcomes = {}
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._undo is not None:
+                yield
+                return
+
+            self._undo = []
+            try:
+                yield
+            except:
+                for undo in reversed(self._undo):
+                    undo()
+                raise
+            finally:
+                self._undo = None
+
+    def _set(self, table, key, value):
+        """Private method to set table[key] to value, undone on rollback."""
+        if self._undo is not None:
+            if key in table:
+                self._undo.append(lambda old=table[key]: table.__setitem__(key, old))
+            else:
+                self._undo.append(lambda: table.pop(key, None))
+        table[key] = value
+
+    def _clear(self, *tables):
+        """Private method to empty tables, undone on rollback."""
+        for table in tables:
+            if self._undo is not None:
+                self._undo.append(lambda table=table, old=dict(table): table.update(old))
+            table.clear()
+
+    def deleteTournaments(self):
+        with self.transaction():
+            if self._players or self._games:
+                raise ValueError("Tournaments still have players or matches.")
+            self._clear(self._tournaments, self._tournament_names)
+
+    def deleteMatches(self):
+        with self.transaction():
+            if self._outcomes:
+                raise ValueError("Matches still have outcomes.")
+            # like trig_reset_standing
+            for _, first_player_id, second_player_id in self._games.itervalues():
+                for player_id in (first_player_id, second_player_id):
+                    if player_id in self._standing:
+                        self._set(self._standing, player_id, (0, 0))
+            self._clear(self._games, self._game_pairs, self._tournament_games)
+
+    def deletePlayers(self):
+        with self.transaction():
+            if self._games:
+                raise ValueError("Players still have matches.")
+            self._clear(self._players, self._tournament_players, self._standing)
+
+    def deleteOutcome(self):
+        with self.transaction():
+            self._clear(self._outcomes)
+
+    def deleteStanding(self):
+        with self.transaction():
+            self._clear(self._standing)
+
+    def countPlayers(self):
+        with self._lock:
+            return len(self._players)
+
+    def createTournament(self, tournament_name):
+        with self.transaction():
+            if tournament_name in self._tournament_names:
+                raise ValueError("Tournament %s already exists." % tournament_name)
+            tournament_id = next(self._tournament_seq)
+            self._set(self._tournaments, tournament_id, tournament_name)
+            self._set(self._tournament_names, tournament_name, tournament_id)
+
+    def tournamentId(self, tournament_name):
+        with self._lock:
+            return self._tournament_names.get(tournament_name)
+
+    def playerTournamentIds(self, player_ids):
+        with self._lock:
+            players = self._players
+            return dict((player_id, players[player_id][0]) for player_id in player_ids if player_id in players)
+
+    def registerPlayer(self, tournament_id, player_name):
+        [(player_id, _)] = self.registerPlayers(tournament_id, [player_name])
+        return player_id
+
+    def registerPlayers(self, tournament_id, player_names):
+        with self.transaction():
+            if tournament_id not in self._tournaments:
+                raise ValueError("Tournament %s does not exist." % tournament_id)
+            tournament_players = self._tournament_players.setdefault(tournament_id, {})
+            new_players = []
+            for player_name in player_names:
+                player_id = next(self._player_seq)
+                self._set(self._players, player_id, (tournament_id, player_name))
+                self._set(tournament_players, player_id, None)
+                # like trig_insert_standing
+                self._set(self._standing, player_id, (0, 0))
+                new_players.append((player_id, player_name))
+            return new_players
+
+    def standings(self, tournament_id):
+        with self._lock:
+            players = self._players
+            standing = self._standing
+            rows = [(player_id, players[player_id][1]) + standing[player_id]
+                    for player_id in self._tournament_players.get(tournament_id, ())
+                    if player_id in standing]
+        # most wins first, in order of registration like the table
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows
+
+    def iterStandings(self, tournament_id, itersize=None):
+        # rows are in memory already; iterate over a snapshot
+        return iter(self.standings(tournament_id))
+
+    def iterMatchHistory(self, tournament_id, itersize=None):
+        with self._lock:
+            players = self._players
+            games = self._games
+            rows = []
+            for game_id in sorted(self._tournament_games.get(tournament_id, ())):
+                _, first_player_id, second_player_id = games[game_id]
+                match = (game_id, first_player_id, players[first_player_id][1],
+                         second_player_id, players[second_player_id][1])
+                for winner_id, _ in self._outcomes.get(game_id, ((None, None),)):
+                    rows.append(match + (winner_id,))
+        # iterate over a snapshot
+        return iter(rows)
+
+    def playedPairs(self, tournament_id):
+        with self._lock:
+            games = self._games
+            return [games[game_id][1:] for game_id in self._tournament_games.get(tournament_id, ())]
+
+    def hasPlayedEarlier(self, first_player_id, second_player_id):
+        with self._lock:
+            return pairing.pairKey(first_player_id, second_player_id) in self._game_pairs
+
+    def createMatch(self, tournament_id, first_player_id, second_player_id):
+        with self.transaction():
+            key = pairing.pairKey(first_player_id, second_player_id)
+            if key in self._game_pairs:
+                raise ValueError("Players %s and %s already have a match." % (first_player_id, second_player_id))
+            game_id = next(self._game_seq)
+            self._set(self._games, game_id, (tournament_id, first_player_id, second_player_id))
+            self._set(self._game_pairs, key, game_id)
+            self._set(self._tournament_games.setdefault(tournament_id, {}), game_id, None)
+
+    def reportMatch(self, winner_id, loser_id):
+        self.reportMatches([(winner_id, loser_id)])
+
+    def reportMatches(self, results):
+        with self.transaction():
+            game_pairs = self._game_pairs
+            game_ids = []
+            for winner_id, loser_id in results:
+                game_id = game_pairs.get(pairing.pairKey(winner_id, loser_id))
+                if game_id is None:
+                    raise ValueError("Expected one game between players %s and %s, found 0."
+                                     % (winner_id, loser_id))
+                game_ids.append(game_id)
+
+            standing = self._standing
+            for game_id, (winner_id, loser_id) in itertools.izip(game_ids, results):
+                self._set(self._outcomes, game_id, self._outcomes.get(game_id, ()) + ((winner_id, loser_id),))
+                # like trig_update_standing
+                if winner_id in standing:
+                    wins, matches = standing[winner_id]
+                    self._set(standing, winner_id, (wins + 1, matches + 1))
+                if loser_id in standing:
+                    wins, matches = standing[loser_id]
+                    self._set(standing, loser_id, (wins, matches + 1))
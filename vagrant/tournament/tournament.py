@@ -2,69 +2,248 @@
 # 
 # tournament.py -- implementation of a Swiss-system tournament
 #
-import random
+import os
+import threading
+from contextlib import contextmanager
 
-import bleach
-import networkx as nx
 import psycopg2
 
+import pairing
+import sanitize
+import storage
+import tracing
+from cache import LRUCache
+from dbpool import ConnectionPool
+from standings import Standings
+
+# process-wide connection pool shared by all public functions,
+# created on first use; see configurePool()
+_pool = None
+
+# settings used to create the pool
+_pool_settings = {'minconn': 1, 'maxconn': 10, 'idle_timeout': 300.0,
+                  'check_on_checkout': True, 'check_after': 30.0, 'wait_timeout': 30.0}
+
+# tournament_name -> tournament_id; names may be reused after deleteTournaments(),
+# so entries expire to bound staleness across processes
+_tournament_id_cache = LRUCache(maxsize=1024, ttl=300.0)
+
+# player_id -> tournament_id; never changes for a player id
+_player_tournament_cache = LRUCache(maxsize=65536)
+
+# tournament_id -> Standings of tournaments tracked in memory,
+# see enableStandingsModel()
+_standings_models = {}
+
+# storage engine of all public functions, created on first use;
+# see useStorage()
+_storage = None
+
+# whether the thread is in a transaction() block
+_local = threading.local()
+
 
 def connect():
     """Connect to the PostgreSQL database.  Returns a database connection."""
     return psycopg2.connect("dbname=tournamentproj")
 
 
+def useStorage(name):
+    """
+    Select the storage engine used by all functions of this module; the
+    TOURNAMENT_STORAGE environment variable selects it at start up.
+    Args:
+        name: 'postgres' to keep tournaments in the database of tournament.sql
+         (default), 'memory' to keep them in this process only, e.g. for
+         simulations and tests.
+    """
+    global _storage
+
+    if name == 'postgres':
+        _storage = storage.PostgresStorage(_getPool)
+    elif name == 'memory':
+        _storage = storage.MemoryStorage()
+    else:
+        raise ValueError("Unknown storage: %s" % name)
+
+    # ids of the previous engine mean nothing to the new one
+    _tournament_id_cache.clear()
+    _player_tournament_cache.clear()
+    _standings_models.clear()
+
+
+def getStorage():
+    """Returns: the storage engine in use, see useStorage() and storage.py."""
+    if _storage is None:
+        useStorage(os.environ.get('TOURNAMENT_STORAGE', 'postgres'))
+    return _storage
+
+
+def configurePool(**settings):
+    """
+    Configure the connection pool used by all functions of this module.
+    Open connections of the current pool are closed; the new pool is created
+    on next use.
+    Args:
+        minconn: no. of idle connections kept open regardless of idle_timeout.
+        maxconn: max no. of connections open at the same time.
+        idle_timeout: seconds after which an idle connection is closed.
+        check_on_checkout: verify a connection with 'SELECT 1' before use.
+        check_after: seconds a connection has to be idle before it is verified.
+        wait_timeout: seconds to wait for a free connection when the pool
+         is exhausted.
+    """
+    global _pool
+
+    for key in settings:
+        if key not in _pool_settings:
+            raise TypeError("Unknown pool setting: %s" % key)
+    _pool_settings.update(settings)
+
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def poolStats():
+    """
+    Returns: dict of pool counters (hits, misses, waits, wait_time, timeouts,
+     checks, discarded, reaped, size, idle). All zero if the pool has not been used yet.
+    """
+    return _getPool().stats()
+
+
+def cacheStats():
+    """
+    Returns: dict with the counters (hits, misses, hit_rate, size) of the
+     'tournament' (name -> id) and 'player' (player id -> tournament id) caches.
+    """
+    return {'tournament': _tournament_id_cache.stats(),
+            'player': _player_tournament_cache.stats()}
+
+
+def enableStandingsModel(tournament_name):
+    """
+    Load the standings of a tournament into memory. Until disabled,
+    playerStandings() and swissPairings() read them from memory and the
+    functions of this module that change players or results keep them up to
+    date after they commit.
+    Only changes made through this process are seen; call again to reload
+    when other processes report results for the same tournament.
+    Args:
+        tournament_name: name of the tournament.
+    """
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        raise ValueError("Tournament %s does not exist." % tournament_name)
+
+    _standings_models.pop(tournament_id, None)
+    _standings_models[tournament_id] = Standings(playerStandings(tournament_name))
+
+
+def disableStandingsModel(tournament_name):
+    """
+    Drop the in-memory standings of a tournament; standings are read from
+    the database again.
+    Args:
+        tournament_name: name of the tournament.
+    """
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is not None:
+        _standings_models.pop(tournament_id, None)
+
+
+def _getPool():
+    """Private method returning the process-wide pool, creating it if needed."""
+    global _pool
+
+    if _pool is None:
+        _pool = ConnectionPool(connect, **_pool_settings)
+    return _pool
+
+
+@contextmanager
+def transaction():
+    """
+    Context manager running the calls of this module made in its block, by the
+    same thread, in one transaction of the storage engine: they are all
+    committed when the block succeeds and all rolled back when it raises.
+    Nested blocks join the outer one.
+    In-memory standings are updated as the calls are made and reloaded if the
+    transaction is rolled back.
+    """
+    if getattr(_local, 'active', False):
+        yield
+        return
+
+    _local.active = True
+    try:
+        with getStorage().transaction():
+            yield
+    except:
+        # names, players and standings read or changed in the block may be gone
+        _tournament_id_cache.clear()
+        _player_tournament_cache.clear()
+        for tournament_id in _standings_models.keys():
+            _standings_models[tournament_id] = Standings(getStorage().standings(tournament_id))
+        raise
+    finally:
+        _local.active = False
+
+
+@tracing.traced
 def deleteTournaments():
     """Remove tournaments from the database."""
-    # sql statement
-    sql = "DELETE FROM tournament;"
+    getStorage().deleteTournaments()
 
-    # execute sql
-    _exeSql(sql, None)
+    # cached ids are no longer valid
+    _tournament_id_cache.clear()
+    _player_tournament_cache.clear()
+    _standings_models.clear()
 
 
+@tracing.traced
 def deleteMatches():
     """Remove all the matches records from the database."""
-    # sql statement
-    sql = "DELETE FROM game;"
+    getStorage().deleteMatches()
 
-    # execute sql
-    _exeSql(sql, None)
+    # players of the removed matches are reset, like trig_reset_standing
+    for model in _standings_models.values():
+        model.reset()
 
 
+@tracing.traced
 def deletePlayers():
     """Remove all the player records from the database."""
-    # sql statement
-    sql = "DELETE FROM player;"
+    getStorage().deletePlayers()
 
-    # execute sql
-    _exeSql(sql, None)
+    # cached ids are no longer valid
+    _player_tournament_cache.clear()
+    _standings_models.clear()
 
 
+@tracing.traced
 def deleteOutcome():
     """Remove all matches played between players"""
-    sql = "DELETE FROM outcome;"
-
-    # execute sql
-    _exeSql(sql, None)
+    getStorage().deleteOutcome()
 
 
+@tracing.traced
 def deleteStanding():
     """Remove all players standing"""
-    sql = "DELETE FROM standing;"
+    getStorage().deleteStanding()
 
-    # execute sql
-    _exeSql(sql, None)
+    # players without standing don't appear in standings any more
+    _standings_models.clear()
 
 
+@tracing.traced
 def countPlayers():
     """Returns the number of players currently registered."""
-    # sql statement
-    sql = "SELECT COUNT(*) FROM player;"
-
-    return int(_exeSql(sql, None)[0][0])
+    return getStorage().countPlayers()
 
 
+@tracing.traced
 def createTournament(tournament_name):
     """
     Args:
@@ -73,18 +252,18 @@ def createTournament(tournament_name):
 
     Returns:
         NONE
-    """
-    # sql statement
-    sql = "INSERT INTO tournament(tournament_name) VALUES(%(tournament_name)s);"
 
+    Raises:
+        ValueError: if there is a tournament of the same name.
+    """
     # use bleach to
     # escapes or strips markup and attributes
-    tournament_name = bleach.clean(tournament_name)
+    tournament_name = sanitize.clean(tournament_name)
 
-    # execute sql
-    _exeSql(sql, {'tournament_name': tournament_name})
+    getStorage().createTournament(tournament_name)
 
 
+@tracing.traced
 def registerPlayer(tournament_name, player_name):
     """
     Adds a player to the tournament database.
@@ -92,33 +271,78 @@ def registerPlayer(tournament_name, player_name):
         tournament_name: name of the tournament player belongs
         player_name: the player's full name (need not be unique).
     """
-    # sql statement
-    sql = "SELECT tournament_id FROM tournament WHERE tournament_name=%(tournament_name)s;"
+    # use bleach to
+    # escapes or strips markup and attributes
+    tournament_name = sanitize.clean(tournament_name)
+
+    # get tournament_id
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        raise ValueError("Tournament %s does not exist." % tournament_name)
 
     # use bleach to
     # escapes or strips markup and attributes
-    tournament_name = bleach.clean(tournament_name)
+    player_name = sanitize.clean(player_name)
+
+    player_id = getStorage().registerPlayer(tournament_id, player_name)
+
+    model = _standings_models.get(tournament_id)
+    if model is not None:
+        model.addPlayer(player_id, player_name)
 
-    # execute sql to get tournament_id
-    tournament_id = int(_exeSql(sql, {'tournament_name': tournament_name})[0][0])
 
+@tracing.traced
+def registerPlayers(tournament_name, player_names):
+    """
+    Adds many players to the tournament database in a single transaction.
+    The tournament is resolved once; with PostgreSQL, names are streamed to the
+    server with COPY and the players' standing rows are created with one
+    set-based insert.
+    Args:
+        tournament_name: name of the tournament players belong
+        player_names: iterable of the players' full names (need not be unique).
+
+    Returns: no. of players registered.
+
+    Raises:
+        ValueError: if the tournament does not exist.
+    """
     # use bleach to
     # escapes or strips markup and attributes
-    player_name = bleach.clean(player_name)
+    tournament_name = sanitize.clean(tournament_name)
+
+    # get tournament_id
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        raise ValueError("Tournament %s does not exist." % tournament_name)
+
+    new_players = getStorage().registerPlayers(tournament_id,
+                                               (sanitize.clean(player_name) for player_name in player_names))
 
-    # sql statement
-    sql = "INSERT INTO player(tournament_id, player_name) VALUES(%(tournament_id)s, %(player_name)s);"
+    model = _standings_models.get(tournament_id)
+    if model is not None:
+        for player_id, player_name in new_players:
+            model.addPlayer(player_id, player_name)
 
-    # execute sql
-    _exeSql(sql, {'tournament_id': tournament_id, 'player_name': player_name})
+    return len(new_players)
 
 
-def playerStandings(tournament_name):
+@tracing.traced
+def playerStandings(tournament_name, lazy=False, itersize=None):
     """Returns a list of the players and their win records, sorted by wins.
 
     The first entry in the list should be the player in first place, or a player
     tied for first place if there is currently a tie.
 
+    Args:
+      tournament_name: name of the tournament.
+      lazy: return an iterator instead of a list; with PostgreSQL, rows are
+        streamed from a server-side cursor, so large tournaments are never
+        held in memory at once. Read it to the end or close it to give its
+        connection back to the pool.
+      itersize: no. of rows per round-trip of a lazy result, default
+        storage.STREAM_ITERSIZE.
+
     Returns:
       A list of tuples, each of which contains (id, name, wins, matches):
         id: the player's unique id (assigned by the database)
@@ -126,15 +350,48 @@ def playerStandings(tournament_name):
         wins: the number of matches the player has won
         matches: the number of matches the player has played
     """
-    # create query
-    sql = "SELECT player_id, player_name, player_win_count, player_game_count " \
-          "FROM vw_player_details " \
-          "WHERE tournament_name=%(tournament_name)s " \
-          "ORDER BY player_win_count DESC;"
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        return iter([]) if lazy else []
+
+    model = _standings_models.get(tournament_id)
+    if model is not None:
+        rows = model.rows()
+        return iter(rows) if lazy else rows
+
+    if lazy:
+        return getStorage().iterStandings(tournament_id, itersize)
+    return getStorage().standings(tournament_id)
+
+
+@tracing.traced
+def matchHistory(tournament_name, lazy=False, itersize=None):
+    """Returns the matches of a tournament in the order they were created, e.g.
+    to export it.
+
+    Args:
+      tournament_name: name of the tournament.
+      lazy: return an iterator instead of a list, see playerStandings().
+      itersize: no. of rows per round-trip of a lazy result, default
+        storage.STREAM_ITERSIZE.
+
+    Returns:
+      A list of tuples, each of which contains (game_id, id1, name1, id2, name2, winner_id):
+        game_id: the match's unique id
+        id1, name1: the first player's unique id and name
+        id2, name2: the second player's unique id and name
+        winner_id: id of the player who won, None if not reported yet
+      A match reported more than once appears once per outcome.
+    """
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        return iter([]) if lazy else []
 
-    return _exeSql(sql, {'tournament_name': tournament_name})
+    rows = getStorage().iterMatchHistory(tournament_id, itersize)
+    return rows if lazy else list(rows)
 
 
+@tracing.traced
 def createMatches(first_player_id, second_player_id):
     """
     Create/Fix match between players using their IDs. We can call this function
@@ -142,31 +399,23 @@ def createMatches(first_player_id, second_player_id):
     Args:
         first_player_id: first player's id.
         second_player_id: second player's id.
-    """
-    # create query
-    sql = "SELECT tournament_id " \
-          "FROM player " \
-          "WHERE player_id=%(player_id)s;"
-
-    # exe for first player
-    [(first_player_tournament_id)] = _exeSql(sql, {'player_id': first_player_id})
 
-    # exe for second player
-    [(second_player_tournament_id)] = _exeSql(sql, {'player_id': second_player_id})
-
-    # create query
-    sql = "INSERT INTO game(tournament_id, first_player_id, second_player_id) " \
-          "VALUES(%(tournament_id)s, %(first_player_id)s, %(second_player_id)s);"
+    Raises:
+        ValueError: if the players already have a match.
+    """
+    # get tournament of both players
+    tournament_ids = _playerTournamentIds([first_player_id, second_player_id])
+    first_player_tournament_id = tournament_ids[first_player_id]
+    second_player_tournament_id = tournament_ids[second_player_id]
 
     # verify players belong to same tournament
     if first_player_tournament_id == second_player_tournament_id:
-        # exe query
-        _exeSql(sql, {'tournament_id': first_player_tournament_id, 'first_player_id': first_player_id,
-                     'second_player_id': second_player_id})
+        getStorage().createMatch(first_player_tournament_id, first_player_id, second_player_id)
     else:
         raise AssertionError("Players are not of same tournament.")
 
 
+@tracing.traced
 def reportMatch(winner_id, loser_id):
     """Records the outcome of a single match between two players.
 
@@ -174,52 +423,77 @@ def reportMatch(winner_id, loser_id):
       winner:  the id number of the player who won
       loser:  the id number of the player who lost
     """
-    # create query
-    sql = "SELECT tournament_id FROM player WHERE player_id = %(player_id)s;"
+    # get tournament of both players
+    tournament_ids = _playerTournamentIds([winner_id, loser_id])
+    winner_tournament_id = tournament_ids[winner_id]
+    loser_tournament_id = tournament_ids[loser_id]
 
-    # exe for winner
-    [(winner_tournament_id)] = _exeSql(sql, {'player_id': winner_id})
+    # verify players are of same tournament
+    if winner_tournament_id == loser_tournament_id:
+        getStorage().reportMatch(winner_id, loser_id)
+    else:
+        raise AssertionError("Players are not of same tournament.")
 
-    # exe for loser
-    [(loser_tournament_id)] = _exeSql(sql, {'player_id': loser_id})
+    model = _standings_models.get(winner_tournament_id)
+    if model is not None:
+        model.recordResult(winner_id, loser_id)
+
+
+@tracing.traced
+def reportMatches(results):
+    """Records the outcomes of a whole round in a single transaction.
+
+    All players are validated and all games looked up with one query each; with
+    PostgreSQL, the outcomes are inserted with one multi-row insert and the
+    standings of every player involved are updated with one set-based statement.
+
+    Args:
+      results: iterable of (winner_id, loser_id) tuples.
+
+    Raises:
+      AssertionError: if the players of a result are not of same tournament.
+      ValueError: if a player does not exist, two results are of the same pair
+       of players or there isn't exactly one game between the players of a
+       result.
+    """
+    results = [(int(winner_id), int(loser_id)) for winner_id, loser_id in results]
+    if not results:
+        return
 
-    # create query
-    sql = "SELECT game_id " \
-          "FROM game " \
-          "WHERE (first_player_id=%(winner_id)s AND second_player_id=%(loser_id)s) " \
-          "OR (first_player_id=%(loser_id)s AND second_player_id=%(winner_id)s);"
+    # a pair of players has one match, so one result at most
+    pairs = set()
+    for winner_id, loser_id in results:
+        key = pairing.pairKey(winner_id, loser_id)
+        if key in pairs:
+            raise ValueError("Players %s and %s have more than one result in the batch." % (winner_id, loser_id))
+        pairs.add(key)
 
-    # exe for game_id
-    [(game_id,)] = _exeSql(sql, {'winner_id': winner_id, 'loser_id': loser_id})
+    winner_ids = [winner_id for winner_id, _ in results]
+    loser_ids = [loser_id for _, loser_id in results]
 
-    # create query
-    sql = "INSERT INTO outcome(game_id, winner_player_id, loser_player_id) " \
-          "VALUES(%(game_id)s, %(winner_player_id)s, %(loser_player_id)s);"
+    # tournament of every player involved
+    tournament_ids = _playerTournamentIds(winner_ids + loser_ids)
 
     # verify players are of same tournament
-    if winner_tournament_id == loser_tournament_id:
-        # exe query
-        _exeSql(sql, {'game_id': game_id, 'winner_player_id': winner_id, 'loser_player_id': loser_id})
-    else:
-        raise AssertionError("Players are not of same tournament.")
+    for winner_id, loser_id in results:
+        if tournament_ids[winner_id] != tournament_ids[loser_id]:
+            raise AssertionError("Players are not of same tournament.")
 
+    getStorage().reportMatches(results)
 
-def hasPlayedEarlier(first_player_id, second_player_id):
-    # create query
-    sql = "SELECT COUNT(*) " \
-          "FROM game " \
-          "WHERE (first_player_id=%(first_player_id)s AND second_player_id=%(second_player_id)s) " \
-          "OR (first_player_id=%(second_player_id)s AND second_player_id=%(first_player_id)s);"
+    for winner_id, loser_id in results:
+        model = _standings_models.get(tournament_ids[winner_id])
+        if model is not None:
+            model.recordResult(winner_id, loser_id)
 
-    # exe query
-    matchCount = _exeSql(sql, {'first_player_id': first_player_id, 'second_player_id': second_player_id})
 
-    if int(matchCount[0][0]) == 0:
-        return False
-    else:
-        return True
+@tracing.traced
+def hasPlayedEarlier(first_player_id, second_player_id):
+    """Returns whether the two players have a match, whichever of them is first."""
+    return getStorage().hasPlayedEarlier(first_player_id, second_player_id)
 
 
+@tracing.traced
 def swissPairings(tournament_name):
     """Returns a list of pairs of players for the next round of a match.
   
@@ -235,15 +509,42 @@ def swissPairings(tournament_name):
         id2: the second player's unique id
         name2: the second player's name
     """
-    # retrieve current player standing from DB
-    players_standing = playerStandings(tournament_name)
+    model = _standings_models.get(_tournamentId(tournament_name))
+    if model is not None:
+        # score groups are kept by the in-memory standings
+        players_group = model.groups()
+    else:
+        # retrieve current player standing from DB
+        players_standing = playerStandings(tournament_name)
 
-    # group players by their standing (win_count)
-    players_group = _groupPlayers(players_standing)
+        # group players by their standing (win_count)
+        players_group = _groupPlayers(players_standing)
 
     # print players_group, len(players_group)
 
-    return _makePairs(players_group)
+    # load tournament's match history once instead of
+    # querying it for every candidate pair
+    played_pairs = _playedPairs(tournament_name)
+
+    return _makePairs(players_group, played_pairs)
+
+
+def _playedPairs(tournament_name):
+    """
+    Private method to be used by swissPairings() to load the whole head-to-head
+    history of a tournament with a single query.
+    Args:
+        tournament_name: name of the tournament.
+
+    Returns: set of pairing.pairKey() values, one for every two players who
+     have already been matched against each other.
+    """
+    tournament_id = _tournamentId(tournament_name)
+    if tournament_id is None:
+        return set()
+
+    return set(pairing.pairKey(first_player_id, second_player_id)
+               for first_player_id, second_player_id in getStorage().playedPairs(tournament_id))
 
 
 def _groupPlayers(players_standing):
@@ -283,14 +584,17 @@ def _groupPlayers(players_standing):
     return group_list
 
 
-def _makePairs(players_group):
+def _makePairs(players_group, played_pairs):
     """
     Private method to be used by swissPairing() to pair players according to their
     standings.
-    The algorithm uses graph data structure and 'blossom algorithm' to fix game between players
-    of similar standings.
+    Players are paired within their score group by the pairing engine (see
+    pairing.py); the odd player out floats down to the next group and the
+    'blossom algorithm' is used only for groups the fast search can't pair.
     Args:
         players_group: list of players grouped according to their standings.
+        played_pairs: set of pairing.pairKey() values of players who have
+         already played each other, see _playedPairs().
 
     Returns:
         A list of tuples, each of which contains (id1, name1, id2, name2)
@@ -299,89 +603,58 @@ def _makePairs(players_group):
         id2: the second player's unique id
         name2: the second player's name
     """
-    # create graph
-    graph_ = nx.Graph()
+    return pairing.pairGroups(players_group, played_pairs)
 
-    for group in players_group:
-        # add players to graph
-        graph_.add_nodes_from(group)
 
-        # no. of players in each standing
-        length = len(group)
-
-        for idx, player in enumerate(group):
-            while idx < (length - 1):
-                # weight players randomly to ensure pairing are not always same
-                wgt = random.randint(1, length)
-                # connect nodes (players) only when they have not played
-                # against each other
-                if not hasPlayedEarlier(player[0], group[idx + 1][0]):
-                    graph_.add_edge(player, group[idx + 1], weight=wgt)
-                idx = idx + 1
-
-    # get dict of paired palyers
-    pair_dict = nx.max_weight_matching(graph_)
-
-    # temp dict to store unique pairings
-    temp_pair_dict = {}
-
-    for key, value in pair_dict.iteritems():
-        if not temp_pair_dict.has_key(key):
-            if not key in temp_pair_dict.values():
-                temp_pair_dict[key] = value
-
-    # convert dict to list
-    pair_list_frm_dict = temp_pair_dict.items()
-
-    # final list which will carry
-    # tuples of paired players
-    swiss_pairs = []
-
-    for pair in pair_list_frm_dict:
-        temp_list_of_pairs = []
-        for pl_info in pair:
-            temp_list_of_pairs.append(pl_info[0])
-            temp_list_of_pairs.append(pl_info[1])
-        # convert list of pair to tuple and add
-        # it to final list
-        swiss_pairs.append(tuple(temp_list_of_pairs))
-
-    return swiss_pairs
-
-
-def _exeSql(sql, dict_):
+def _tournamentId(tournament_name):
     """
-    Private method to be used by methods of this class to exe sql query.
+    Private method to resolve a tournament name to its id, through the
+    tournament id cache.
     Args:
-        sql: sql query
-        dict_: dictionary of params that need to be replaced in sql query.
+        tournament_name: name of the tournament.
 
-    Returns: resultSet returned by SELECT statements.
+    Returns: tournament_id, or None if there is no such tournament.
     """
-    # db conn object
-    conn = connect()
+    tournament_id = _tournament_id_cache.get(tournament_name)
+    if tournament_id is not None:
+        return tournament_id
 
-    # Open a cursor to perform database operations
-    cur = conn.cursor()
-
-    # execute sql query
-    if dict_ is None:
-        cur.execute(sql)
-    else:
-        cur.execute(sql, dict_)
+    tournament_id = getStorage().tournamentId(tournament_name)
+    if tournament_id is None:
+        return None
 
-    # declare resultSet
-    resultSet = ()
+    _tournament_id_cache.put(tournament_name, tournament_id)
+    return tournament_id
 
-    # fetch results only for select stmns.
-    if "SELECT" in cur.statusmessage:
-        resultSet = cur.fetchall()
 
-    # make the changes to the db persistent
-    conn.commit()
+def _playerTournamentIds(player_ids):
+    """
+    Private method to look up the tournament of players, through the player
+    cache. Players missing from the cache are fetched with one query.
+    Args:
+        player_ids: iterable of player ids.
 
-    # Close communication with the database
-    cur.close()
-    conn.close()
+    Returns: dict of player_id -> tournament_id.
 
-    return resultSet
+    Raises:
+        ValueError: if a player does not exist.
+    """
+    tournament_ids = {}
+    missing = []
+    for player_id in set(player_ids):
+        tournament_id = _player_tournament_cache.get(player_id)
+        if tournament_id is None:
+            missing.append(player_id)
+        else:
+            tournament_ids[player_id] = tournament_id
+
+    if missing:
+        for player_id, tournament_id in getStorage().playerTournamentIds(missing).iteritems():
+            _player_tournament_cache.put(player_id, tournament_id)
+            tournament_ids[player_id] = tournament_id
+
+        for player_id in missing:
+            if player_id not in tournament_ids:
+                raise ValueError("Player %s does not exist." % player_id)
+
+    return tournament_ids
@@ -52,10 +52,42 @@ player_game_count INTEGER NOT NULL DEFAULT 0
 );
 
 
+-- CREATE INDEXES
+-- idx_tournament_name
+-- tournaments are looked up by name (tournament._tournamentId)
+CREATE UNIQUE INDEX idx_tournament_name ON tournament(tournament_name);
+
+-- idx_player_tournament
+-- players of a tournament (playerStandings, vw_player_details)
+CREATE INDEX idx_player_tournament ON player(tournament_id);
+
+-- idx_game_pair
+-- canonical unordered pair key: the game between two players, whichever of them
+-- is first (hasPlayedEarlier, reportMatch, reportMatches); two players meet once
+CREATE UNIQUE INDEX idx_game_pair ON game(LEAST(first_player_id, second_player_id),
+                                          GREATEST(first_player_id, second_player_id));
+
+-- idx_game_tournament
+-- match history of a tournament (swissPairings)
+CREATE INDEX idx_game_tournament ON game(tournament_id);
+
+-- idx_outcome_game
+-- outcomes of a game; also checked by the foreign key when games are deleted
+CREATE INDEX idx_outcome_game ON outcome(game_id);
+
+-- idx_standing_player
+-- standing of a player, one row per player (standing triggers, playerStandings)
+CREATE UNIQUE INDEX idx_standing_player ON standing(player_id);
+
+
 -- CREATE FUNCTIONS
 -- func_insert_standing
+-- bulk loaders (tournament.registerPlayers) create standing rows set-wise, see func_update_standing
 CREATE OR REPLACE FUNCTION func_insert_standing() RETURNS TRIGGER AS $trig_insert_standing$
 BEGIN
+    IF (current_setting('tournament.bulk_standing', TRUE) = 'on') THEN
+        RETURN NEW;
+    END IF;
     IF (TG_OP = 'INSERT') THEN
         INSERT INTO standing(player_id) VALUES(NEW.player_id);
         RETURN NEW;
@@ -64,8 +96,13 @@ END;
 $trig_insert_standing$ LANGUAGE plpgsql;
 
 -- func_update_standing
+-- bulk loaders (tournament.reportMatches) update standing set-wise and switch the
+-- row-level update off for their transaction with SET LOCAL tournament.bulk_standing = 'on'
 CREATE OR REPLACE FUNCTION func_update_standing() RETURNS TRIGGER AS $trig_update_standing$
 BEGIN
+    IF (current_setting('tournament.bulk_standing', TRUE) = 'on') THEN
+        RETURN NEW;
+    END IF;
     IF (TG_OP = 'INSERT') THEN
         UPDATE standing
             SET player_win_count = player_win_count + 1,
@@ -6,7 +6,13 @@
 # If you do add any of the extra credit options, be sure to add/modify these test cases
 # as appropriate to account for your module's added functionality.
 
+import random
+
 from tournament import *
+from scheduler import pairTournaments
+import storage
+import tournament
+import tracing
 
 
 def testCount():
@@ -260,6 +266,479 @@ def testMultiTournament():
     print "11. In both the tournaments after 1st round, players with one win are properly paired."
 
 
+def testReportMatchesBatch():
+    """
+    Test that a whole round reported at once updates standings like reportMatch().
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Rugby Tournament"
+    createTournament(tournament_name)
+    registerPlayer(tournament_name, "Bruno Walton")
+    registerPlayer(tournament_name, "Boots O'Neal")
+    registerPlayer(tournament_name, "Cathy Burton")
+    registerPlayer(tournament_name, "Diane Grant")
+    standings = playerStandings(tournament_name)
+    [id1, id2, id3, id4] = [row[0] for row in standings]
+    createMatches(id1, id2)
+    createMatches(id3, id4)
+    reportMatches([(id1, id2), (id4, id3)])
+    standings = playerStandings(tournament_name)
+    for (i, n, w, m) in standings:
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+        if i in (id1, id4) and w != 1:
+            raise ValueError("Each match winner should have one win recorded.")
+        elif i in (id2, id3) and w != 0:
+            raise ValueError("Each match loser should have zero wins recorded.")
+    try:
+        reportMatches([(id1, id3)])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Reporting a match that was never created should fail.")
+    if [row[3] for row in playerStandings(tournament_name)] != [1, 1, 1, 1]:
+        raise ValueError("A failed batch should not change standings.")
+    print "12. After a batch of matches, players have updated standings."
+
+
+def testRegisterPlayersBatch():
+    """
+    Test that players registered in bulk are counted and appear in standings.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Hockey Tournament"
+    createTournament(tournament_name)
+    names = ["Player %d" % i for i in range(100)] + ["Tab\tand\\backslash"]
+    c = registerPlayers(tournament_name, iter(names))
+    if c != 101 or countPlayers() != 101:
+        raise ValueError("After registering 101 players in bulk, countPlayers() should be 101.")
+    standings = playerStandings(tournament_name)
+    if set(row[1] for row in standings) != set(names):
+        raise ValueError("Players registered in bulk should appear in standings.")
+    for (i, n, w, m) in standings:
+        if w != 0 or m != 0:
+            raise ValueError("Newly registered players should have no matches or wins.")
+    print "13. Players registered in bulk appear in the standings with no matches."
+
+
+def testStandingsModel():
+    """
+    Test that in-memory standings stay consistent with the standing table.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Polo Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North"])
+    enableStandingsModel(tournament_name)
+    registerPlayer(tournament_name, "John Smith")
+    registerPlayers(tournament_name, ["William Hunt", "Daniel D", "Jessica Jones"])
+    standings = playerStandings(tournament_name)
+    [id1, id2, id3, id4, id5, id6, id7, id8] = [row[0] for row in standings]
+    createMatches(id1, id2)
+    createMatches(id3, id4)
+    createMatches(id5, id6)
+    createMatches(id7, id8)
+    reportMatch(id1, id2)
+    reportMatches([(id3, id4), (id5, id6), (id7, id8)])
+    pairings = swissPairings(tournament_name)
+    _chkPairLength(pairings)
+    _chkValidPairs(standings, pairings)
+    in_memory = playerStandings(tournament_name)
+    disableStandingsModel(tournament_name)
+    if sorted(in_memory) != sorted(playerStandings(tournament_name)):
+        raise ValueError("In-memory standings should match the standing table.")
+    if [row[2] for row in in_memory] != [1, 1, 1, 1, 0, 0, 0, 0]:
+        raise ValueError("In-memory standings should be sorted by wins.")
+    print "14. In-memory standings are kept consistent with the standing table."
+
+
+def testIndexScans():
+    """
+    Test that the hot lookups of tournament.py are served by index scans.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Squash Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North"])
+    [id1, id2, id3, id4] = [row[0] for row in playerStandings(tournament_name)]
+    createMatches(id1, id2)
+    createMatches(id3, id4)
+    # players of one match meet only once, in whichever order
+    try:
+        createMatches(id2, id1)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("createMatches should not create a second match between two players.")
+    if not hasPlayedEarlier(id2, id1) or hasPlayedEarlier(id1, id3):
+        raise ValueError("hasPlayedEarlier should find a match whichever player is first.")
+    reportMatch(id2, id1)
+    if getStorage().name != 'postgres':
+        print "15. Games are looked up by their unordered pair of players."
+        return
+
+    # tables of the test are tiny, so make the planner use any usable index
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SET enable_seqscan = off;")
+    # the queries storage.py sends, with the name of their prepared statement
+    queries = [
+        ("idx_game_pair", storage.PostgresStorage._HAS_PLAYED_EARLIER_SQL, 'stmt_has_played_earlier'),
+        ("idx_game_pair", storage.PostgresStorage._GAME_ID_SQL, 'stmt_game_id'),
+        ("idx_game_pair", storage.PostgresStorage._RESULT_GAMES_SQL, None),
+        ("idx_tournament_name", storage.PostgresStorage._TOURNAMENT_ID_SQL, 'stmt_tournament_id'),
+        ("player_pkey", storage.PostgresStorage._PLAYER_TOURNAMENT_IDS_SQL, 'stmt_player_tournament_ids'),
+        ("idx_player_tournament", storage.PostgresStorage._STANDINGS_SQL, 'stmt_standings'),
+        ("idx_game_tournament", storage.PostgresStorage._PLAYED_PAIRS_SQL, 'stmt_played_pairs'),
+        ("idx_standing_player", storage.PostgresStorage._UPDATE_STANDINGS_SQL, None),
+        ("idx_outcome_game", storage.PostgresStorage._MATCH_HISTORY_SQL, None),
+    ]
+    try:
+        cur.execute("SELECT tournament_id FROM tournament WHERE tournament_name=%s;", (tournament_name,))
+        params = {'first_player_id': id2, 'second_player_id': id1, 'winner_id': id2, 'loser_id': id1,
+                  'winner_ids': [id2], 'loser_ids': [id1], 'player_ids': [id1, id2], 'wins': [0, 1],
+                  'games': [1, 1], 'tournament_name': tournament_name, 'tournament_id': cur.fetchone()[0]}
+        for index, sql, name in queries:
+            explains = ["EXPLAIN " + sql]
+            if name is not None:
+                # prepared statements switch to a generic plan after a few runs,
+                # check that one too (PostgreSQL 12+)
+                prepare, execute = storage._statement(name, sql)
+                cur.execute(prepare)
+                if conn.server_version >= 120000:
+                    cur.execute("SET plan_cache_mode = force_generic_plan;")
+                explains.append("EXPLAIN " + execute)
+            for explain in explains:
+                cur.execute(explain, params)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+                if index not in plan:
+                    raise ValueError("Expected a scan of %s, got:\n%s" % (index, plan))
+            if name is not None and conn.server_version >= 120000:
+                cur.execute("RESET plan_cache_mode;")
+    finally:
+        conn.rollback()
+        conn.close()
+    print "15. Games, players, tournaments and standings are looked up through indexes."
+
+
+def testTransaction():
+    """
+    Test that calls made in a transaction() block are committed or rolled back together.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Fencing Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North",
+                                      "John Smith", "William Hunt"])
+    [id1, id2, id3, id4, id5, id6] = [row[0] for row in playerStandings(tournament_name)]
+    enableStandingsModel(tournament_name)
+    try:
+        with transaction():
+            createMatches(id1, id2)
+            reportMatch(id1, id2)
+            raise KeyError("rolled back")
+    except KeyError:
+        pass
+    if hasPlayedEarlier(id1, id2):
+        raise ValueError("Matches created in a rolled back transaction should not exist.")
+    try:
+        with transaction():
+            registerPlayer(tournament_name, "Rolled Back")
+            [id7] = [row[0] for row in playerStandings(tournament_name) if row[1] == "Rolled Back"]
+            createMatches(id1, id7)
+            raise KeyError("rolled back")
+    except KeyError:
+        pass
+    try:
+        createMatches(id2, id7)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Players registered in a rolled back transaction should not get matches.")
+    if [row[2] for row in playerStandings(tournament_name)] != [0] * 6:
+        raise ValueError("In-memory standings should be reloaded after a rollback.")
+    with transaction():
+        createMatches(id1, id2)
+        createMatches(id3, id4)
+        createMatches(id5, id6)
+        reportMatches([(id1, id2), (id3, id4)])
+        # standing trigger is on again after the bulk update
+        reportMatch(id5, id6)
+    in_memory = playerStandings(tournament_name)
+    disableStandingsModel(tournament_name)
+    standings = playerStandings(tournament_name)
+    if sorted(in_memory) != sorted(standings) or [row[2] for row in standings] != [1, 1, 1, 0, 0, 0]:
+        raise ValueError("Each match of the transaction should be counted once.")
+    print "16. Calls made in a transaction are committed or rolled back together."
+
+
+def testPairTournaments():
+    """
+    Test that pairTournaments() pairs and creates the matches of many tournaments.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_names = ["Golf Tournament", "Rugby Tournament", "Tennis Tournament"]
+    for tournament_name in tournament_names:
+        createTournament(tournament_name)
+        registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North",
+                                          "John Smith", "William Hunt", "Daniel D", "Jessica Jones"])
+    paired = pairTournaments(tournament_names + tournament_names[:1], processes=2)
+    if sorted(paired) != tournament_names:
+        raise ValueError("pairTournaments should pair every tournament once.")
+    for tournament_name in tournament_names:
+        pairings = paired[tournament_name]
+        _chkPairLength(pairings)
+        for (pid1, pname1, pid2, pname2) in pairings:
+            if not hasPlayedEarlier(pid1, pid2):
+                raise ValueError("pairTournaments should create the matches of its pairings.")
+    print "17. Many tournaments are paired in parallel and their matches created."
+
+
+def testTracing():
+    """
+    Test that traced statements are attributed to the public calls that issued them.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Rowing Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North"])
+    tracing.reset()
+    tracing.enable()
+    try:
+        swissPairings(tournament_name)
+    finally:
+        tracing.disable()
+    swissPairings(tournament_name)
+    stats = tracing.stats()
+    calls = dict((row['caller'], row['count']) for row in stats['calls'])
+    if calls != {'swissPairings': 1, 'swissPairings > playerStandings': 1}:
+        raise ValueError("Each traced call should be counted once, under the calls it was made from.")
+    if getStorage().name == 'postgres':
+        standings = [row for row in stats['statements'] if row['caller'] == 'swissPairings > playerStandings'
+                     and 'stmt_standings' in row['statement']]
+        if len(standings) != 1 or standings[0]['count'] != 1:
+            raise ValueError("Statements should be attributed to the call that issued them.")
+        if standings[0]['rows'] != 4:
+            raise ValueError("Rows returned by a statement should be counted.")
+    if "swissPairings > playerStandings" not in tracing.report():
+        raise ValueError("The report should list every traced call.")
+    if '_call_duration_seconds_count{caller="swissPairings"} 1' not in tracing.metrics():
+        raise ValueError("The metrics should count every traced call.")
+    tracing.reset()
+    print "18. Statements are traced by the public calls that issued them."
+
+
+def testPreparedStatements():
+    """
+    Test that prepared statements are prepared once per connection, and again after a reconnect
+    or a session reset.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Archery Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North"])
+    [id1, id2, id3, id4] = [row[0] for row in playerStandings(tournament_name)]
+    createMatches(id1, id2)
+    if getStorage().name != 'postgres':
+        print "19. Prepared statements are only used by the PostgreSQL storage."
+        return
+
+    def prepares():
+        # PREPAREs of stmt_has_played_earlier sent by one hasPlayedEarlier() call
+        tracing.reset()
+        tracing.enable()
+        try:
+            if not hasPlayedEarlier(id2, id1) or hasPlayedEarlier(id1, id3):
+                raise ValueError("hasPlayedEarlier should give the same answers prepared.")
+        finally:
+            tracing.disable()
+        return sum(row['count'] for row in tracing.stats()['statements']
+                   if row['statement'].startswith("PREPARE stmt_has_played_earlier"))
+
+    prepares()
+    if prepares() != 0:
+        raise ValueError("A statement should be prepared once per connection.")
+    # new pool, new connections
+    configurePool()
+    if prepares() != 1:
+        raise ValueError("A statement should be prepared again on a new connection.")
+    # new engine, same connections
+    useStorage('postgres')
+    if prepares() != 0:
+        raise ValueError("A statement prepared on a connection should be reused by any engine.")
+    # session reset on the server, e.g. by a connection pooler
+    conn = tournament._getPool().getconn()
+    conn.cursor().execute("DEALLOCATE ALL;")
+    conn.commit()
+    tournament._getPool().putconn(conn)
+    if prepares() != 1:
+        raise ValueError("A statement lost by the server should be prepared again and retried.")
+    playerStandings(tournament_name)
+    # one statement lost on the server, another forgotten by the registry
+    conn = tournament._getPool().getconn()
+    conn.cursor().execute("DEALLOCATE stmt_has_played_earlier;")
+    conn.commit()
+    storage._prepared[conn].discard('stmt_standings')
+    tournament._getPool().putconn(conn)
+    if prepares() != 1:
+        raise ValueError("A statement lost by the server should be prepared again and retried.")
+    tracing.reset()
+    tracing.enable()
+    try:
+        for _ in range(2):
+            if len(playerStandings(tournament_name)) != 4:
+                raise ValueError("Statements the registry forgot should still run.")
+    finally:
+        tracing.disable()
+    if any(row['statement'].startswith("PREPARE stmt_standings") and row['count'] != 1
+           for row in tracing.stats()['statements']):
+        raise ValueError("A statement the registry forgot should be taken as prepared once.")
+    tracing.reset()
+    print "19. Prepared statements are prepared once per connection, and again after a reconnect or reset."
+
+
+def testLazyResults():
+    """
+    Test that standings and match history can be streamed instead of loaded at once.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Judo Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North",
+                                      "John Smith", "William Hunt"])
+    [id1, id2, id3, id4, id5, id6] = [row[0] for row in playerStandings(tournament_name)]
+    createMatches(id1, id2)
+    createMatches(id3, id4)
+    createMatches(id5, id6)
+    reportMatches([(id2, id1), (id3, id4)])
+    standings = playerStandings(tournament_name, lazy=True, itersize=2)
+    if isinstance(standings, list) or list(standings) != playerStandings(tournament_name):
+        raise ValueError("Lazy standings should yield the rows of playerStandings().")
+    history = matchHistory(tournament_name)
+    if [row[1:] for row in history] != [(id1, "Roger Rabbit", id2, "Smith Jones", id2),
+                                        (id3, "Jon Doe", id4, "Dan North", id3),
+                                        (id5, "John Smith", id6, "William Hunt", None)] \
+            or [row[0] for row in history] != sorted(row[0] for row in history):
+        raise ValueError("matchHistory should list every match with its winner, oldest first.")
+    if list(matchHistory(tournament_name, lazy=True, itersize=1)) != history:
+        raise ValueError("Lazy match history should yield the rows of matchHistory().")
+    if list(matchHistory("No Such Tournament", lazy=True)) != []:
+        raise ValueError("Match history of a missing tournament should be empty.")
+    if getStorage().name == 'postgres':
+        # a stream read halfway holds a connection until it is closed
+        stats = poolStats()
+        checked_out = stats['size'] - stats['idle']
+        standings = playerStandings(tournament_name, lazy=True, itersize=2)
+        next(standings)
+        stats = poolStats()
+        if stats['size'] - stats['idle'] != checked_out + 1:
+            raise ValueError("A lazy result should read from its own connection.")
+        standings.close()
+        stats = poolStats()
+        if stats['size'] - stats['idle'] != checked_out:
+            raise ValueError("Closing a lazy result should give its connection back to the pool.")
+    print "20. Standings and match history can be streamed."
+
+
+def testPairingsAcrossGroups():
+    """
+    Test that players left over after the last score group are paired by re-pairing the groups above.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Karate Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Player 1", "Player 2", "Player 3", "Player 4", "Player 5", "Player 6"])
+    ids = dict((name, player_id) for player_id, name, _, _ in playerStandings(tournament_name))
+    [p1, p2, p3, p4, p5, p6] = [ids["Player %d" % i] for i in xrange(1, 7)]
+    # after two rounds the score groups are [5], [1, 2, 3, 4], [6]; 1 and 6
+    # have met, so pairing the groups top down can leave both of them out
+    # while 5-1, 6-2, 3-4 is open
+    for winner_id, loser_id in [(p5, p4), (p1, p6), (p2, p3), (p5, p2), (p3, p1), (p4, p6)]:
+        createMatches(winner_id, loser_id)
+        reportMatch(winner_id, loser_id)
+    for seed in xrange(50):
+        random.seed(seed)
+        pairings = swissPairings(tournament_name)
+        if len(pairings) != 3 or len(set(pid for (pid1, _, pid2, _) in pairings for pid in (pid1, pid2))) != 6:
+            raise ValueError("Every player should be paired exactly once.")
+        for (pid1, pname1, pid2, pname2) in pairings:
+            if hasPlayedEarlier(pid1, pid2):
+                raise ValueError("Pairings should not repeat a match.")
+    print "21. Players left over after the last score group are paired across groups."
+
+
+def testReportMatchesOneInsert():
+    """
+    Test that reportMatches() inserts a whole round with one statement, however large.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Hockey Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Player %d" % i for i in xrange(512)])
+    pairings = swissPairings(tournament_name)
+    for (pid1, pname1, pid2, pname2) in pairings:
+        createMatches(pid1, pid2)
+    tracing.reset()
+    tracing.enable()
+    try:
+        reportMatches([(pid1, pid2) for (pid1, pname1, pid2, pname2) in pairings])
+    finally:
+        tracing.disable()
+    if [row[3] for row in playerStandings(tournament_name)] != [1] * 512:
+        raise ValueError("Each player should have one match recorded.")
+    if getStorage().name == 'postgres':
+        inserts = sum(row['count'] for row in tracing.stats()['statements']
+                      if row['statement'].startswith("INSERT INTO outcome"))
+        if inserts != 1:
+            raise ValueError("A round of 256 results should be inserted with one statement, not %d." % inserts)
+    tracing.reset()
+    print "22. A whole round is reported with one insert."
+
+
 def _chkPairLength(pairings):
     if len(pairings) != 4:
         raise ValueError(
@@ -286,10 +765,109 @@ def _chkValidPairs(standings, pairings):
                 "After one match, players with one win should be paired.")
 
 
+def testDeleteReferenced():
+    """
+    Test that every storage engine refuses to delete rows other rows still refer to
+    with ValueError, and that the Storage interface can't be used as an engine.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Fencing Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones"])
+    [id1, id2] = [row[0] for row in playerStandings(tournament_name)]
+    createMatches(id1, id2)
+    reportMatch(id1, id2)
+    for delete in (deleteMatches, deletePlayers, deleteTournaments):
+        try:
+            delete()
+        except ValueError:
+            pass
+        else:
+            raise ValueError("%s() should refuse to delete rows still referred to." % delete.__name__)
+    if countPlayers() != 2 or not hasPlayedEarlier(id1, id2):
+        raise ValueError("Refused deletions should leave the data as it was.")
+    try:
+        storage.Storage()
+    except TypeError:
+        pass
+    else:
+        raise ValueError("Storage is an interface and should not be instantiable.")
+    print "23. Rows still referred to are not deleted, on every storage engine."
+
+
+def testPoolHealthCheck():
+    """
+    Test that the pool checks only connections that were idle longer than check_after.
+    """
+    if getStorage().name != 'postgres':
+        print "24. Only the PostgreSQL storage uses the connection pool."
+        return
+    try:
+        configurePool()
+        countPlayers()
+        countPlayers()
+        if poolStats()['checks'] != 0:
+            raise ValueError("A connection used a moment ago should not be checked again.")
+        configurePool(check_after=0.0)
+        countPlayers()
+        countPlayers()
+        if poolStats()['checks'] != 1:
+            raise ValueError("A connection idle longer than check_after should be checked.")
+    finally:
+        configurePool(check_after=30.0)
+    print "24. Only connections idle for a while are checked on checkout."
+
+
+def testReportMatchesDuplicate():
+    """
+    Test that a batch reporting a pair of players twice is refused as a whole, on every storage engine.
+    """
+    deleteStanding()
+    deleteOutcome()
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    tournament_name = "Fencing Tournament"
+    createTournament(tournament_name)
+    registerPlayers(tournament_name, ["Roger Rabbit", "Smith Jones", "Jon Doe", "Dan North"])
+    [id1, id2, id3, id4] = [row[0] for row in playerStandings(tournament_name)]
+    createMatches(id1, id2)
+    createMatches(id3, id4)
+    for results in ([(id1, id2), (id3, id4), (id1, id2)], [(id1, id2), (id3, id4), (id2, id1)]):
+        try:
+            reportMatches(results)
+        except ValueError as e:
+            if "more than one result" not in str(e):
+                raise ValueError("A repeated result should be reported as such, not: %s" % e)
+        else:
+            raise ValueError("A batch reporting a pair of players twice should be refused.")
+    if [row[3] for row in playerStandings(tournament_name)] != [0] * 4:
+        raise ValueError("A refused batch should not record any result.")
+    print "25. A batch reporting a pair of players twice is refused."
+
+
 if __name__ == '__main__':
     testCount()
     testStandingsBeforeMatches()
     testReportMatches()
     testPairings()
     testMultiTournament()
+    testReportMatchesBatch()
+    testRegisterPlayersBatch()
+    testStandingsModel()
+    testIndexScans()
+    testTransaction()
+    testPairTournaments()
+    testTracing()
+    testPreparedStatements()
+    testLazyResults()
+    testPairingsAcrossGroups()
+    testReportMatchesOneInsert()
+    testDeleteReferenced()
+    testPoolHealthCheck()
+    testReportMatchesDuplicate()
     print "Success!  All tests pass!"
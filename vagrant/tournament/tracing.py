@@ -0,0 +1,336 @@
+#
+# tracing.py -- opt-in query tracing for tournament.py
+#
+# Off by default; enable() or TOURNAMENT_TRACE=1 in the environment turns it
+# on. While on, every statement storage.PostgresStorage sends is timed and
+# counted per statement template and per chain of public functions of
+# tournament.py that issued it, e.g. "swissPairings > playerStandings", and
+# every public call is timed too. Export with report() (text) or metrics()
+# (Prometheus text format). While off, traced functions and cursors only
+# check a flag.
+#
+# Counters are kept per process; worker processes of scheduler.py trace
+# their own queries.
+#
+# The web forum traces forumdb through this module too, see
+# ../forum/tracing.py; keep it free of imports of the tournament app.
+#
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# caller of statements issued outside of the public functions
+NO_CALLER = '-'
+
+_enabled = os.environ.get('TOURNAMENT_TRACE') == '1'
+
+_lock = threading.Lock()
+# (caller, statement) -> _Stat of the statement
+_statements = {}
+# caller -> _Stat of its calls
+_calls = {}
+
+# names of the public functions the thread is in, outermost first
+_local = threading.local()
+
+# sql text -> statement template, for statements sent with parameters
+_templates = {}
+_TEMPLATES_SIZE = 1024
+
+# literals of statements sent without parameters, e.g. by execute_values()
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# rows of a multi-row VALUES list, once literals are replaced
+_ROWS = re.compile(r"(\((?:\?, ?)*\?\))(?:, ?\((?:\?, ?)*\?\))+")
+_SPACES = re.compile(r"\s+")
+
+
+class _Stat(object):
+    """Count, total seconds, rows and latency histogram of a statement or call."""
+
+    __slots__ = ('count', 'seconds', 'rows', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        # no. of samples per bucket of BUCKETS, the last one unbounded
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, rows):
+        self.count += 1
+        self.seconds += seconds
+        if rows > 0:
+            self.rows += rows
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def copy(self):
+        copy = _Stat()
+        copy.count, copy.seconds, copy.rows = self.count, self.seconds, self.rows
+        copy.buckets = list(self.buckets)
+        return copy
+
+    def percentile(self, fraction):
+        """
+        Returns: upper bound in seconds of the bucket holding the given
+         fraction of the samples, float('inf') if beyond the last bucket.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {'count': self.count,
+                'total_ms': 1000.0 * self.seconds,
+                'mean_ms': 1000.0 * self.seconds / self.count if self.count else 0.0,
+                'p99_ms': 1000.0 * self.percentile(0.99),
+                'rows': self.rows}
+
+
+def enable():
+    """Start tracing; counters of earlier traces are kept, see reset()."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop tracing; counters are kept until reset()."""
+    global _enabled
+    _enabled = False
+
+
+def isEnabled():
+    """Returns: whether tracing is on."""
+    return _enabled
+
+
+def reset():
+    """Forget all counters."""
+    with _lock:
+        _statements.clear()
+        _calls.clear()
+
+
+def traced(function):
+    """
+    Decorator of the public functions of tournament.py (and of the traced
+    calls of the forum): while tracing, times every call and attributes the
+    statements issued during it to the function, and to the traced functions
+    it was called from.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+
+        stack = _stack()
+        stack.append(name)
+        caller = ' > '.join(stack)
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.time() - start
+            stack.pop()
+            with _lock:
+                stat = _calls.get(caller)
+                if stat is None:
+                    stat = _calls[caller] = _Stat()
+                stat.add(seconds, 0)
+
+    return wrapper
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """Cursor timing and counting its statements while tracing is on."""
+
+    def execute(self, query, vars=None):
+        if not _enabled:
+            return super(TracingCursor, self).execute(query, vars)
+        start = time.time()
+        try:
+            return super(TracingCursor, self).execute(query, vars)
+        finally:
+            _record(_template(query, vars is not None), time.time() - start, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        if not _enabled:
+            return super(TracingCursor, self).executemany(query, vars_list)
+        start = time.time()
+        try:
+            return super(TracingCursor, self).executemany(query, vars_list)
+        finally:
+            _record(_template(query, True), time.time() - start, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        if not _enabled:
+            return super(TracingCursor, self).copy_expert(sql, file, size)
+        start = time.time()
+        try:
+            return super(TracingCursor, self).copy_expert(sql, file, size)
+        finally:
+            _record(_template(sql, False), time.time() - start, self.rowcount)
+
+
+def stats():
+    """
+    Returns: dict with
+        calls: list of dicts of caller, count, total_ms, mean_ms, p99_ms of
+         the traced calls, slowest first;
+        statements: list of dicts of caller, statement, count, total_ms,
+         mean_ms, p99_ms and rows (returned or changed) of the statements,
+         slowest first.
+     p99_ms is the upper bound of the histogram bucket of the 99th percentile.
+    """
+    with _lock:
+        calls = [dict(caller=caller, **stat.summary()) for caller, stat in _calls.iteritems()]
+        statements = [dict(caller=caller, statement=statement, **stat.summary())
+                      for (caller, statement), stat in _statements.iteritems()]
+    calls.sort(key=lambda row: -row['total_ms'])
+    statements.sort(key=lambda row: -row['total_ms'])
+    return {'calls': calls, 'statements': statements}
+
+
+def report(width=100):
+    """
+    Returns: text report of the traced statements grouped by the call that
+     issued them, slowest call first.
+    Args:
+        width: statements are cut to this many characters.
+    """
+    current = stats()
+    statements = {}
+    for row in current['statements']:
+        statements.setdefault(row['caller'], []).append(row)
+    calls = dict((row['caller'], row) for row in current['calls'])
+
+    def total(caller):
+        if caller in calls:
+            return calls[caller]['total_ms']
+        return sum(row['total_ms'] for row in statements[caller])
+
+    callers = sorted(set(calls) | set(statements), key=lambda caller: -total(caller))
+    lines = ["%d statements in %d calls; p99 is the upper bound of its latency bucket"
+             % (sum(row['count'] for row in current['statements']),
+                sum(row['count'] for row in current['calls']))]
+    for caller in callers:
+        rows = statements.get(caller, [])
+        call = calls.get(caller)
+        lines.append("")
+        if call is None:
+            lines.append("%s: %d statements" % (caller, sum(row['count'] for row in rows)))
+        else:
+            lines.append("%s: %d calls, %.2f ms total, %.2f ms mean, %.2f ms p99, %d statements"
+                         % (caller, call['count'], call['total_ms'], call['mean_ms'], call['p99_ms'],
+                            sum(row['count'] for row in rows)))
+        if rows:
+            lines.append("  %8s %10s %9s %9s %9s  %s" % ('count', 'total ms', 'mean ms', 'p99 ms', 'rows',
+                                                       'statement'))
+        for row in rows:
+            statement = row['statement']
+            if len(statement) > width:
+                statement = statement[:width - 3] + '...'
+            lines.append("  %8d %10.2f %9.3f %9.3f %9d  %s" % (row['count'], row['total_ms'], row['mean_ms'],
+                                                              row['p99_ms'], row['rows'], statement))
+    return "\n".join(lines) + "\n"
+
+
+def metrics(prefix='tournament'):
+    """
+    Returns: the counters in the Prometheus text exposition format:
+        <prefix>_query_duration_seconds: histogram of the statements by
+         caller and statement;
+        <prefix>_query_rows_total: rows returned or changed, by caller and
+         statement;
+        <prefix>_call_duration_seconds: histogram of the traced calls by caller.
+    """
+    with _lock:
+        statements = sorted((key, stat.copy()) for key, stat in _statements.iteritems())
+        calls = sorted((caller, stat.copy()) for caller, stat in _calls.iteritems())
+
+    lines = ["# HELP %s_query_duration_seconds Latency of database statements." % prefix,
+             "# TYPE %s_query_duration_seconds histogram" % prefix]
+    for (caller, statement), stat in statements:
+        lines.extend(_histogram(prefix + '_query_duration_seconds',
+                                'caller="%s",statement="%s"' % (_label(caller), _label(statement)), stat))
+
+    lines.append("# HELP %s_query_rows_total Rows returned or changed by database statements." % prefix)
+    lines.append("# TYPE %s_query_rows_total counter" % prefix)
+    for (caller, statement), stat in statements:
+        lines.append('%s_query_rows_total{caller="%s",statement="%s"} %d'
+                     % (prefix, _label(caller), _label(statement), stat.rows))
+
+    lines.append("# HELP %s_call_duration_seconds Latency of public API calls." % prefix)
+    lines.append("# TYPE %s_call_duration_seconds histogram" % prefix)
+    for caller, stat in calls:
+        lines.extend(_histogram(prefix + '_call_duration_seconds', 'caller="%s"' % _label(caller), stat))
+    return "\n".join(lines) + "\n"
+
+
+def _stack():
+    """Private function returning the thread's stack of traced calls."""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _template(query, has_params):
+    """
+    Private function returning the template of a statement: its text with
+    whitespace collapsed; literals of statements sent without parameters are
+    replaced by ? and multi-row VALUES lists cut to their first row.
+    """
+    if has_params:
+        template = _templates.get(query)
+        if template is None:
+            if len(_templates) >= _TEMPLATES_SIZE:
+                _templates.clear()
+            template = _templates[query] = _SPACES.sub(' ', query).strip()
+        return template
+
+    template = _LITERALS.sub('?', _SPACES.sub(' ', query).strip())
+    return _ROWS.sub(r'\1, ...', template)
+
+
+def _record(statement, seconds, rows):
+    """Private function adding a statement to the counters of the thread's caller."""
+    stack = getattr(_local, 'stack', None)
+    key = (' > '.join(stack) if stack else NO_CALLER, statement)
+    with _lock:
+        stat = _statements.get(key)
+        if stat is None:
+            stat = _statements[key] = _Stat()
+        stat.add(seconds, rows)
+
+
+def _histogram(name, labels, stat):
+    """Private function returning the lines of a histogram in the Prometheus format."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, stat.buckets):
+        cumulative += count
+        lines.append('%s_bucket{%s,le="%r"} %d' % (name, labels, bound, cumulative))
+    lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, stat.count))
+    lines.append('%s_sum{%s} %r' % (name, labels, stat.seconds))
+    lines.append('%s_count{%s} %d' % (name, labels, stat.count))
+    return lines
+
+
+def _label(value):
+    """Private function escaping a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')